@@ -1,5 +1,11 @@
+import io
 import sys
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # only needed by --batch
+
 def compute_final_grade(x, p):
     final_grade = (0.7 * x) + (0.3 * p)
     return final_grade
@@ -7,6 +13,9 @@ def compute_final_grade(x, p):
 def main():
     # Read all input at once
     input_lines = sys.stdin.read().splitlines()
+    print_results(input_lines)
+
+def print_results(input_lines):
     n = int(input_lines[0])  # First line is the number of students
 
     for i in range(1, n + 1):  # Iterate over each student's data
@@ -41,6 +50,201 @@ def main():
     # Flush the output buffer to ensure all output is displayed
     sys.stdout.flush()
 
+
+# ------------------------------------------------------------------------
+# Batch mode (python P1.py --batch): the same output as main(), computed
+# with NumPy on columns of students instead of one student at a time, a
+# block of lines at a time. The numbers are parsed straight from the bytes;
+# anything that isn't plain decimal numbers (exponents, inf/nan, "1_000",
+# blank or short lines, ...) goes through main()'s loop instead, so the
+# output (or the error) is always exactly what main() gives.
+# ------------------------------------------------------------------------
+BATCH_CHARACTERS = b' \t\n0123456789.+-'
+# Digits a parsed number may have: below 2**53, so a float is exact
+MAX_DIGITS = 15
+# Input read at a time (whole lines), small enough for the arrays to stay in cache
+BLOCK_SIZE = 1 << 20
+# Blanks after a block, so that reading past a token stays in bounds
+PADDING = b' ' * (MAX_DIGITS + 3)
+
+def main_batch():
+    if np is None:
+        sys.exit("python P1.py --batch needs NumPy (pip install numpy)")
+    data = sys.stdin.buffer.read()
+    output = batch_output(data)
+    if output is None:
+        # Decode the way sys.stdin.read() would have
+        text = io.TextIOWrapper(io.BytesIO(data), encoding=sys.stdin.encoding,
+                                errors=sys.stdin.errors).read()
+        print_results(text.splitlines())
+        return
+    sys.stdout.flush()
+    sys.stdout.buffer.write(output)
+    sys.stdout.flush()
+
+def batch_output(data):
+    """The output for data, or None if it has to be read line by line."""
+    if not data.isascii():
+        return None
+    header_end = data.find(b'\n')
+    header = data[:header_end] if header_end >= 0 else data
+    if not header.strip() or header.translate(None, b' \t0123456789+-'):
+        return None
+    try:
+        n = int(header)
+    except ValueError:
+        return None
+
+    output = []
+    start = header_end + 1 if header_end >= 0 else len(data)
+    while n > 0:
+        # The next lines, up to BLOCK_SIZE bytes but at least one line
+        end = data.rfind(b'\n', start, start + BLOCK_SIZE) + 1
+        if end <= start:
+            end = data.find(b'\n', start) + 1 or len(data)
+        block = data[start:end]
+        if not block:
+            return None  # fewer than n lines: main() raises an IndexError
+        start = end
+        if not block.endswith(b'\n'):
+            block += b'\n'  # the last line has no newline
+        line_ends = np.flatnonzero(np.frombuffer(block, np.uint8) == ord('\n'))
+        if len(line_ends) > n:
+            block = block[:line_ends[n - 1] + 1]
+            line_ends = line_ends[:n]
+        n -= len(line_ends)
+        if block.translate(None, BATCH_CHARACTERS):
+            return None
+
+        columns = parse_columns(block, line_ends)
+        if columns is None:
+            return None
+        participation, homework_correct, homework_sufficient, exam, project = columns
+        final_grade = compute_final_grade(exam, project)
+        is_pass = (
+            (exam >= 5.5) &
+            (project >= 5.5) &
+            (final_grade >= 5.5) &
+            (participation >= 8) &
+            ((homework_correct >= 5) |
+             ((homework_correct >= 3) & (homework_correct < 5) &
+              ((homework_sufficient == 1) | (homework_sufficient == 2))))
+        )
+        output.append(format_results(final_grade, is_pass))
+    return b''.join(output)
+
+def parse_columns(block, line_ends):
+    """The five columns of the lines in block as arrays, or None."""
+    chars = np.frombuffer(block + PADDING, np.uint8)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+
+    # The usual layout, five tokens and one blank between them, is read
+    # token after token from the start of each line
+    columns = []
+    starts = line_starts
+    for j in range(5):
+        parsed = parse_numbers(chars, starts, is_int=j < 3)
+        if parsed is None:
+            break
+        values, ends = parsed
+        columns.append(values)
+        starts = ends + 1
+    else:
+        if (ends == line_ends).all():
+            return columns
+
+    # Anything else: find every token first
+    blank = chars <= ord(' ')
+    starts = np.flatnonzero(blank[:-1] & ~blank[1:]) + 1
+    if not blank[0]:
+        starts = np.concatenate(([0], starts))
+    first = np.searchsorted(starts, line_starts)
+    if (np.diff(np.append(first, len(starts))) < 5).any():
+        return None  # a blank or short line: main() raises an IndexError
+    columns = []
+    for j in range(5):
+        parsed = parse_numbers(chars, starts[first + j], is_int=j < 3)
+        if parsed is None:
+            return None
+        columns.append(parsed[0])
+    return columns
+
+def parse_numbers(chars, starts, is_int):
+    """Parse the tokens that start at starts, like int() or float() would.
+
+    Returns the values and where each token ends, or None if a token isn't
+    [+-]digits (ints) or [+-]digits[.digits] (floats) of up to MAX_DIGITS
+    digits. A float is its digits divided by a power of ten: both are
+    exact, so the division rounds to the same float as float() does.
+    """
+    count = len(starts)
+    value = np.zeros(count, np.int64)
+    length = np.zeros(count, np.uint8)
+    digits = np.zeros(count, np.uint8)
+    dots = np.zeros(count, np.uint8)
+    decimals = np.zeros(count, np.uint8)
+    seen_dot = np.zeros(count, bool)
+    active = np.ones(count, bool)
+    for k in range(MAX_DIGITS + 3):
+        c = np.take(chars, starts + k)
+        if k == 0:
+            negative = c == ord('-')
+            signed = negative | (c == ord('+'))
+        active &= c > ord(' ')
+        if not active.any():
+            break
+        length += active
+        digit = c - ord('0')  # wraps around for the other characters
+        is_digit = active & (digit < 10)
+        digits += is_digit
+        # value = value * 10 + digit, where there is a digit
+        digit *= is_digit
+        value *= (is_digit * np.uint8(9) + np.uint8(1)).astype(np.int64)
+        value += digit.astype(np.int64)
+        if not is_int:
+            is_dot = c == ord('.')
+            dots += is_dot
+            decimals += is_digit & seen_dot
+            seen_dot |= is_dot
+    else:
+        return None  # too long
+    # Whatever isn't a digit must be the sign or (for a float) the one dot
+    if ((digits == 0) | (digits > MAX_DIGITS) | (length != digits + signed + dots)).any():
+        return None
+    ends = starts + length
+    if not is_int:
+        if (dots > 1).any():
+            return None
+        value = value / (10.0 ** np.arange(MAX_DIGITS + 1))[decimals]
+    if negative.any():
+        value = np.where(negative, -value, value)
+    return value, ends
+
+def format_results(final_grade, is_pass):
+    """The output, as print() writes it."""
+    passed = np.flatnonzero(is_pass)
+    tenths = final_grade[passed] * 10
+    # round(x, 1) rounds the exact value of x, which tenths only
+    # approximates: near a .x5 tie, or for large values, ask Python
+    exact = (np.abs(tenths) < 1e5) & (np.abs(tenths - np.floor(tenths) - 0.5) > 1e-6)
+    # Each line as an index into texts: FAIL, then every grade that occurs
+    texts = [b'FAIL\n']
+    line_text = np.zeros(len(is_pass), np.int32)
+    if exact.any():
+        rounded = np.rint(tenths[exact]).astype(np.int64)
+        low = rounded.min()
+        texts += [('PASS ' + str(t / 10) + '\n').encode() for t in range(low, rounded.max() + 1)]
+        line_text[passed[exact]] = rounded - low + 1
+    for i in passed[~exact]:
+        line_text[i] = len(texts)
+        texts.append(('PASS ' + str(round(float(final_grade[i]), 1)) + '\n').encode())
+    # Every line padded to the same width, and the padding taken out again
+    width = max(len(text) for text in texts)
+    table = np.array([text.ljust(width, b'\0') for text in texts], 'S%d' % width)
+    return table[line_text].tobytes().translate(None, b'\0')
+
 if __name__ == "__main__":
-    main()
-    
\ No newline at end of file
+    if '--batch' in sys.argv[1:]:
+        main_batch()
+    else:
+        main()
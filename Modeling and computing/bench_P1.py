@@ -0,0 +1,62 @@
+"""
+Benchmark: P1.py line by line against P1.py --batch on the same input.
+
+Writes N random students (in the format of samples/sample-P1.in) to a
+temporary file, runs both modes on it, checks that the outputs are
+byte-for-byte the same and prints the times and the speedup.
+
+Usage:
+    python bench_P1.py [--students 10000000] [--seed 1]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_students(path, count, seed):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write(f"{count}\n")
+        for _ in range(count):
+            f.write(f"{rng.randint(0, 10)} {rng.randint(0, 7)} {rng.randint(0, 3)} "
+                    f"{round(rng.uniform(0, 10), 2)} {round(rng.uniform(0, 10), 2)}\n")
+
+
+def run(args, input_path):
+    """Run P1.py with args; return (stdout, seconds)."""
+    with open(input_path, 'rb') as stdin:
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(HERE, 'P1.py')] + args,
+                                stdin=stdin, stdout=subprocess.PIPE, check=True)
+        return result.stdout, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="P1.py line by line vs --batch.")
+    parser.add_argument('--students', type=int, default=10_000_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'P1.in')
+        print(f"Writing {args.students} students...", flush=True)
+        write_students(input_path, args.students, args.seed)
+
+        lines, line_seconds = run([], input_path)
+        print(f"line by line  {line_seconds:7.2f} s", flush=True)
+        batch, batch_seconds = run(['--batch'], input_path)
+        print(f"--batch       {batch_seconds:7.2f} s", flush=True)
+
+    if batch != lines:
+        sys.exit("The outputs differ")
+    print(f"Same output ({len(lines)} bytes), {line_seconds / batch_seconds:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
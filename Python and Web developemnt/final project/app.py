@@ -1,17 +1,223 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Response, stream_with_context, g, has_request_context, has_app_context
+from flask import before_render_template, template_rendered, send_file
+from flask import Blueprint, current_app, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
-from functools import wraps
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.exc import IntegrityError, DisconnectionError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import NullPool
+from sqlalchemy.schema import CreateTable
+from werkzeug.serving import is_running_from_reloader
+from werkzeug.utils import safe_join
+from functools import lru_cache, partial, wraps
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, date
-
-app = Flask(__name__)
-
-# Basic Config
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///example.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.secret_key = 'my_super_secret_key'
-
-db = SQLAlchemy(app)
+import click
+from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import OrderedDict
+import bisect
+import csv
+import gzip
+import heapq
+import hashlib
+import io
+import json
+import math
+import mimetypes
+import os
+import pathlib
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it, static assets are only pre-compressed with gzip
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows: only READ_SNAPSHOT needs it (for its file lock)
+    fcntl = None
+
+class Config:
+    """Default settings.
+
+    create_app() overrides them from, in order: instance/config.py, the
+    Python file named by APP_CONFIG_FILE, environment variables with the
+    same name as the setting (DATABASE_URL for the database URI), and the
+    mapping passed to create_app().
+    """
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///example.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Signs the session cookie. When not configured, a random key is
+    # generated once and kept in instance/secret_key, so that it survives
+    # restarts and is the same in every worker process.
+    SECRET_KEY = None
+
+    # Connection pool of each process (see SQLALCHEMY_ENGINE_OPTIONS)
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_TIMEOUT = 30
+    # Seconds after which a pooled connection is replaced (-1: never)
+    DB_POOL_RECYCLE = -1
+
+    # How many time logs are shown per page on the dashboards
+    LOGS_PER_PAGE = 50
+    # How many employees / projects the manager dashboard lists per page
+    DASHBOARD_PAGE_SIZE = 50
+    # How many imported rows are inserted per executemany / commit
+    IMPORT_BATCH_SIZE = 10000
+    # How many rows the payroll export fetches from the database at a time
+    EXPORT_BATCH_SIZE = 5000
+
+    # Password hashing: werkzeug method string (the iteration count is the cost)
+    # and how many hashes may be computed at the same time
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000000'
+    PASSWORD_HASH_WORKERS = 2
+
+    # SQL statements slower than this are written to the log (see /metrics)
+    SLOW_QUERY_MS = 200.0
+
+    # In-memory cache of rendered pages (see cached_page)
+    PAGE_CACHE_MAX_ENTRIES = 256
+    PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    # Background jobs: how many run at the same time, and where their files
+    # (exports, uploaded imports) are kept (default: instance/jobs)
+    JOB_WORKERS = 1
+    JOB_FILES_DIR = None
+    # Jobs step aside while requests are being served, for at most this long
+    # at a time (0: never wait)
+    JOB_YIELD_MS = 50.0
+
+    # Group commit of new time logs (see GroupCommitWriter): off by default.
+    # A batch is whatever arrives within the window, up to the batch size;
+    # its commit uses the given synchronous level (FULL: fsync per batch).
+    GROUP_COMMIT = False
+    GROUP_COMMIT_WINDOW_MS = 2.0
+    GROUP_COMMIT_MAX_BATCH = 256
+    GROUP_COMMIT_SYNCHRONOUS = 'FULL'
+
+    # Archive (see archive_time_logs): approved logs older than this many
+    # days are moved out of time_log, this many rows per transaction
+    ARCHIVE_AFTER_DAYS = 365
+    ARCHIVE_BATCH_SIZE = 5000
+
+    # Read snapshot (see ReadSnapshot): off by default. Reports, the payroll
+    # export and /api/summary then read a copy of the database (default:
+    # instance/read_snapshot.db) instead of the live one; a new copy is taken
+    # once the current one is older than READ_SNAPSHOT_MAX_AGE seconds.
+    READ_SNAPSHOT = False
+    READ_SNAPSHOT_PATH = None
+    READ_SNAPSHOT_MAX_AGE = 60.0
+
+    # HTML and JSON responses of at least this many bytes are gzipped for
+    # clients that accept it (see compress_response)
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+
+    # JSON API page sizes (?limit=)
+    API_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 1000
+
+    # SQLite connection settings (empty or 0 to keep SQLite's default). WAL
+    # lets readers and a writer work at the same time; busy_timeout makes a
+    # writer wait for the lock instead of failing with "database is locked".
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT_MS = 10000
+    SQLITE_CACHE_SIZE_KB = 65536
+
+
+# Environment variables that set a differently named setting
+CONFIG_ENV_ALIASES = {'DATABASE_URL': 'SQLALCHEMY_DATABASE_URI'}
+
+
+
+class Session(FlaskSession):
+    """The session of db: sends reads to the read snapshot while one is in
+    use (see use_read_snapshot); writes always go to the live database."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None and not clause.is_dml and has_app_context():
+            snapshot_engine = g.get('read_snapshot_engine')
+            if snapshot_engine is not None:
+                return snapshot_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class SnapshotConnection(sqlite3.Connection):
+    """A read-only connection to the read snapshot."""
+
+
+db = SQLAlchemy(session_options={'class_': Session})
+# All routes, request hooks and CLI commands; registered by create_app()
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+def configure_engine(app, engine):
+    """Hook the listeners below (and the statement timing, see /metrics) into
+    one of app's engines. Only app's own: other engines in the process are
+    none of its business and may be used outside its app context."""
+    event.listen(engine, 'connect', partial(configure_sqlite_connection, app))
+    event.listen(engine, 'checkout', refuse_connection_from_parent)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', partial(_after_cursor_execute, app))
+
+
+def configure_sqlite_connection(app, dbapi_connection, connection_record):
+    """Apply app's SQLITE_* settings to every new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    journal_mode = app.config['SQLITE_JOURNAL_MODE']
+    synchronous = app.config['SQLITE_SYNCHRONOUS']
+    if isinstance(dbapi_connection, SnapshotConnection):
+        # Nothing is ever written there
+        journal_mode = synchronous = None
+    busy_timeout = app.config['SQLITE_BUSY_TIMEOUT_MS']
+    cache_size = app.config['SQLITE_CACHE_SIZE_KB']
+
+    cursor = dbapi_connection.cursor()
+    if journal_mode:
+        if journal_mode.upper() not in ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'):
+            raise ValueError(f"Unknown SQLITE_JOURNAL_MODE: {journal_mode}")
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+    if synchronous:
+        if synchronous.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"Unknown SQLITE_SYNCHRONOUS: {synchronous}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+    if busy_timeout:
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout:d}")
+    if cache_size:
+        # A negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{cache_size:d}")
+    cursor.close()
+    connection_record.info['pid'] = os.getpid()
+
+
+def refuse_connection_from_parent(dbapi_connection, connection_record, connection_proxy):
+    """Never use a pooled connection that was opened before a fork.
+
+    Two processes sharing one SQLite connection corrupt each other's
+    state. The pool discards the connection and opens a new one instead.
+    serve.py disposes of the pool in each worker as well; this also covers
+    other pre-fork servers.
+    """
+    pid = connection_record.info.get('pid')
+    if pid is not None and pid != os.getpid():
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise DisconnectionError(f"Connection opened in process {pid}, used in {os.getpid()}")
 
 # ------------------------------------------------------------------------
 # Association Table for Many-to-Many: A user can have multiple projects
@@ -20,7 +226,9 @@ db = SQLAlchemy(app)
 employee_projects = db.Table(
     'employee_projects',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('project_id', db.Integer, db.ForeignKey('project.id'), primary_key=True)
+    db.Column('project_id', db.Integer, db.ForeignKey('project.id'), primary_key=True),
+    # The primary key covers lookups by user; this one covers lookups by project
+    db.Index('ix_employee_projects_project', 'project_id', 'user_id')
 )
 
 # ------------------------------------------------------------------------
@@ -28,6 +236,10 @@ employee_projects = db.Table(
 # ------------------------------------------------------------------------
 
 class User(db.Model):
+    # AUTOINCREMENT: ids of deleted employees stay in the archive and the
+    # rollups (see _delete_owner), so SQLite must never hand them out again
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(150), nullable=False)
@@ -52,6 +264,9 @@ class User(db.Model):
 
 
 class Project(db.Model):
+    # AUTOINCREMENT, like User
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), unique=True, nullable=False)
     description = db.Column(db.String(500), nullable=True)
@@ -78,6 +293,133 @@ class TimeLog(db.Model):
 
     user = db.relationship('User', backref='time_logs')
 
+    # Indexes for the dashboard access paths (the id is implicitly appended,
+    # so they also serve the (log_date, id) keyset ordering):
+    #  - employee dashboard: one user's approved / pending logs by date
+    #  - manager dashboard: the pending queue by date
+    #  - per-project sums of approved hours (covering, no table lookup)
+    # AUTOINCREMENT: the archive keeps the ids of the logs it takes out
+    # (see archive_time_logs), so they must not be handed out again
+    __table_args__ = (
+        db.Index('ix_time_log_user_approved_date', 'user_id', 'approved', 'log_date'),
+        db.Index('ix_time_log_approved_date', 'approved', 'log_date'),
+        db.Index('ix_time_log_project_approved_hours', 'project_id', 'approved', 'hours'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class HoursRollup(db.Model):
+    """Approved hours per user and project, summed per day, week and month.
+
+    Kept up to date together with the approved-hour counters (see
+    add_to_rollups) so reports never have to read TimeLog itself.
+    """
+    period = db.Column(db.String(5), primary_key=True)       # 'day', 'week' or 'month'
+    bucket_start = db.Column(db.Date, primary_key=True)      # first day of the bucket
+    user_id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, primary_key=True)     # 0 for logs without a project
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+
+    # One user's buckets (employee dashboard, reports filtered by employee,
+    # deleting an employee)
+    __table_args__ = (
+        db.Index('ix_hours_rollup_user', 'user_id', 'period', 'project_id', 'hours'),
+        # One project's buckets (reports filtered by project, deleting a project)
+        db.Index('ix_hours_rollup_project', 'project_id', 'period', 'user_id', 'hours'),
+    )
+
+
+class DataVersion(db.Model):
+    """Single row (id 1) whose version goes up with every commit that
+    changes data; used to key and validate cached pages."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    """A background job (see submit_job). The row is the job's whole state,
+    so jobs survive a restart."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')        # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    done = db.Column(db.Integer, nullable=False, default=0)          # progress: done of total
+    total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)      # result file name or a short summary
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status', 'status', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'kind': self.kind, 'status': self.status,
+            'done': self.done, 'total': self.total,
+            'progress': self.done / self.total if self.total else None,
+            'result': self.result, 'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# ------------------------------------------------------------------------
+# Password hashing. PBKDF2 is slow on purpose, so hashes are computed on a
+# small dedicated thread pool: a burst of logins can only keep
+# PASSWORD_HASH_WORKERS cores busy and the other requests keep running.
+# (hashlib releases the GIL while it hashes.)
+# ------------------------------------------------------------------------
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    """Return the password hashing pool, creating it on first use.
+
+    Created lazily so that each worker process gets its own threads.
+    """
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                _hash_pool = ThreadPoolExecutor(
+                    max_workers=current_app.config['PASSWORD_HASH_WORKERS'],
+                    thread_name_prefix='password-hash'
+                )
+    return _hash_pool
+
+
+def hash_password(password):
+    """Hash a password with the configured method, on the hashing pool."""
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    return get_hash_pool().submit(generate_password_hash, password, method=method).result()
+
+
+def verify_password(stored_hash, password):
+    """Check a password against a stored hash, on the hashing pool."""
+    return get_hash_pool().submit(check_password_hash, stored_hash, password).result()
+
+
+@lru_cache
+def hash_method_prefix(method):
+    """What a hash made with method starts with (before the first '$').
+
+    werkzeug fills in the defaults of a short method name, e.g. 'scrypt'
+    becomes 'scrypt:32768:8:1', so it is taken from a real hash.
+    """
+    return generate_password_hash('x', method=method).split('$', 1)[0]
+
+
+def needs_rehash(stored_hash):
+    """True if a stored hash was made with other settings than the current ones."""
+    return stored_hash.split('$', 1)[0] != hash_method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
 
 
 # ------------------------------------------------------------------------
@@ -86,13 +428,1042 @@ class TimeLog(db.Model):
 def create_admin():
     admin = User.query.filter_by(username="admin").first()
     if not admin:
-        hashed_password = generate_password_hash("1234", method='pbkdf2:sha256')
+        hashed_password = hash_password("1234")
         admin = User(username="admin", password=hashed_password, role="admin")
         db.session.add(admin)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another process created it at the same time
+            db.session.rollback()
+            return
         print("Admin user created: admin / 1234")
 
 
+def upgrade_db():
+    """Create missing tables and indexes on an existing database.
+
+    db.create_all() skips tables that already exist, so indexes that were
+    added to a model later are created here one by one, and tables created
+    before they were AUTOINCREMENT are rebuilt (see use_autoincrement).
+    """
+    db.create_all()
+    archives = [archive_table(year) for year in archive_years()]
+    db.session.rollback()
+    logs, rollups = [TimeLog.__table__] + archives, HoursRollup.__table__
+    use_autoincrement(User.__table__, [rollups.c.user_id] + [t.c.user_id for t in logs])
+    use_autoincrement(Project.__table__, [rollups.c.project_id] + [t.c.project_id for t in logs])
+    if use_autoincrement(TimeLog.__table__, [t.c.id for t in archives]):
+        # Logs that got the id of an archived one before: a new id, so that
+        # archiving them doesn't collide
+        columns = [c.name for c in TimeLog.__table__.columns if c.name != 'id']
+        with db.engine.begin() as conn:
+            for archive in archives:
+                taken = TimeLog.__table__.c.id.in_(db.select(archive.c.id))
+                conn.execute(TimeLog.__table__.insert().from_select(
+                    columns, db.select(*(TimeLog.__table__.c[name] for name in columns)).where(taken)))
+                conn.execute(TimeLog.__table__.delete().where(taken))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    create_search_index()
+
+
+def use_autoincrement(table, used_ids):
+    """Rebuild table with AUTOINCREMENT if it was created without it.
+
+    Without AUTOINCREMENT SQLite gives the id of a deleted last row to the
+    next new one. New ids also start above every id in the used_ids columns
+    (ids other tables still hold). Returns True if the table was rebuilt.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    sql = db.session.scalar(
+        db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': table.name})
+    db.session.rollback()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return False
+
+    # Next to the other tables, for its foreign keys
+    metadata = db.MetaData()
+    for other in db.metadata.tables.values():
+        other.to_metadata(metadata)
+    new_table = table.to_metadata(metadata, name=f'_{table.name}_new')
+    columns = ', '.join(f'"{c.name}"' for c in table.columns)
+    with db.engine.begin() as conn:
+        # The steps of https://www.sqlite.org/lang_altertable.html#otheralter;
+        # the indexes and search triggers are created again by upgrade_db
+        conn.execute(CreateTable(new_table))
+        conn.exec_driver_sql(f'INSERT INTO "{new_table.name}" ({columns}) SELECT {columns} FROM "{table.name}"')
+        conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+        conn.exec_driver_sql(f'ALTER TABLE "{new_table.name}" RENAME TO "{table.name}"')
+        highest = max([conn.scalar(db.select(db.func.max(c))) or 0 for c in used_ids]
+                      + [conn.scalar(db.select(db.func.max(table.c.id))) or 0])
+        if not conn.execute(db.text("UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = :name"),
+                            {'seq': highest, 'name': table.name}).rowcount:
+            conn.execute(db.text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                         {'seq': highest, 'name': table.name})
+    return True
+
+
+def init_db():
+    """Set up the database at startup: schema, indexes and the admin user.
+
+    Run once before serving, not per request: serve.py and `python app.py`
+    do it themselves; with `flask run`, gunicorn and the like, run
+    `flask init-db` (or create_db.py) first.
+    """
+    upgrade_db()
+    if db.session.get(DataVersion, 1) is None:
+        db.session.add(DataVersion(id=1))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+    create_admin()
+
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create the database, or bring an older one up to date (see init_db)."""
+    init_db()
+    print("Database ready.")
+
+
+# ------------------------------------------------------------------------
+# Approved-hour counters: Project.total_hours and User.hours_worked are
+# kept up to date on every write that changes approved hours, so the
+# dashboard can read them directly instead of summing TimeLog each time.
+# ------------------------------------------------------------------------
+def adjust_approved_hours(user_id, project_id, delta, log_date):
+    """Add delta to the approved-hour counters of a user and a project,
+    and to the rollup buckets of log_date.
+
+    Only queues the UPDATEs on the current session; the caller commits them
+    together with the TimeLog change.
+    """
+    if not delta:
+        return
+    User.query.filter(User.id == user_id).update(
+        {User.hours_worked: db.func.coalesce(User.hours_worked, 0.0) + delta},
+        synchronize_session=False
+    )
+    if project_id is not None:
+        Project.query.filter(Project.id == project_id).update(
+            {Project.total_hours: db.func.coalesce(Project.total_hours, 0.0) + delta},
+            synchronize_session=False
+        )
+    add_to_rollups([(user_id, project_id, log_date, delta)])
+
+
+def adjust_approved_hours_many(user_hours, project_hours):
+    """Apply many counter changes at once: {user_id: delta}, {project_id: delta}.
+
+    Each dict is sent as a single executemany UPDATE.
+    """
+    users, projects = User.__table__, Project.__table__
+    if user_hours:
+        db.session.execute(
+            users.update()
+                .where(users.c.id == db.bindparam('key'))
+                .values(hours_worked=db.func.coalesce(users.c.hours_worked, 0.0) + db.bindparam('delta')),
+            [{'key': k, 'delta': v} for k, v in user_hours.items()]
+        )
+    if project_hours:
+        db.session.execute(
+            projects.update()
+                .where(projects.c.id == db.bindparam('key'))
+                .values(total_hours=db.func.coalesce(projects.c.total_hours, 0.0) + db.bindparam('delta')),
+            [{'key': k, 'delta': v} for k, v in project_hours.items()]
+        )
+
+
+def delete_time_log(log):
+    """Delete a TimeLog and take its hours off the counters if it was approved."""
+    if log.approved:
+        adjust_approved_hours(log.user_id, log.project_id, -(log.hours or 0.0), log.log_date)
+    db.session.delete(log)
+
+
+def approve_time_logs(conditions):
+    """Approve every pending TimeLog matching conditions, set-based.
+
+    conditions is a list of SQLAlchemy filters on TimeLog. The counters and
+    rollups are raised first (the first write takes SQLite's write lock, so
+    nothing can change the pending rows in between), then all matching rows
+    are flipped with one UPDATE. Returns the number of approved rows; the
+    caller commits.
+    """
+    pending = [TimeLog.approved == False] + list(conditions)
+    rollup_time_logs(pending)
+
+    user_hours = db.select(db.func.coalesce(db.func.sum(TimeLog.hours), 0.0))\
+        .where(TimeLog.user_id == User.id, *pending)\
+        .scalar_subquery()
+    User.query.filter(User.id.in_(db.select(TimeLog.user_id).where(*pending)))\
+        .update({User.hours_worked: db.func.coalesce(User.hours_worked, 0.0) + user_hours},
+                synchronize_session=False)
+
+    project_hours = db.select(db.func.coalesce(db.func.sum(TimeLog.hours), 0.0))\
+        .where(TimeLog.project_id == Project.id, *pending)\
+        .scalar_subquery()
+    Project.query.filter(Project.id.in_(db.select(TimeLog.project_id).where(*pending)))\
+        .update({Project.total_hours: db.func.coalesce(Project.total_hours, 0.0) + project_hours},
+                synchronize_session=False)
+
+    return TimeLog.query.filter(*pending)\
+        .update({TimeLog.approved: True}, synchronize_session=False)
+
+
+def reconcile_totals():
+    """Rebuild the approved-hour counters from TimeLog and the archive (fixes any drift)."""
+    user_sum, project_sum = 0.0, 0.0
+    for table in time_log_tables():
+        user_sum += db.select(db.func.coalesce(db.func.sum(table.c.hours), 0.0))\
+            .where(table.c.user_id == User.id, table.c.approved == True)\
+            .scalar_subquery()
+        project_sum += db.select(db.func.coalesce(db.func.sum(table.c.hours), 0.0))\
+            .where(table.c.project_id == Project.id, table.c.approved == True)\
+            .scalar_subquery()
+    db.session.execute(db.update(User).values(hours_worked=user_sum))
+    db.session.execute(db.update(Project).values(total_hours=project_sum))
+    db.session.commit()
+
+
+@bp.cli.command('reconcile-totals')
+def reconcile_totals_command():
+    """Recompute User.hours_worked and Project.total_hours from TimeLog."""
+    reconcile_totals()
+    print("Approved-hour totals rebuilt from TimeLog.")
+
+
+def time_log_filters(data, table=None):
+    """Build TimeLog filters from request data (form, query string or JSON).
+
+    Understands project_id, user_id, date_from and date_to ("YYYY-MM-DD");
+    empty or missing fields are ignored. Raises ValueError on bad values.
+    With table (an archive table), the filters are on its columns instead.
+    """
+    columns = (TimeLog.__table__ if table is None else table).c
+    conditions = []
+    try:
+        if data.get('project_id'):
+            conditions.append(columns.project_id == int(data['project_id']))
+        if data.get('user_id'):
+            conditions.append(columns.user_id == int(data['user_id']))
+        if data.get('date_from'):
+            date_from = datetime.strptime(data['date_from'], '%Y-%m-%d').date()
+            conditions.append(columns.log_date >= date_from)
+        if data.get('date_to'):
+            date_to = datetime.strptime(data['date_to'], '%Y-%m-%d').date()
+            conditions.append(columns.log_date <= date_to)
+    except TypeError:
+        raise ValueError("invalid filter value")
+    return conditions
+
+
+# ------------------------------------------------------------------------
+# Rollups: approved hours per (user, project) summed into day, week and
+# month buckets in HoursRollup. Every change to approved hours also goes
+# through here, so reports read a handful of buckets instead of TimeLog.
+# Weeks start on Monday.
+# ------------------------------------------------------------------------
+ROLLUP_PERIODS = ('day', 'week', 'month')
+
+
+def bucket_start(period, day):
+    """First day of the day / week / month bucket that day falls in."""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def rollup_upsert(stmt=None):
+    """INSERT that adds to the hours of an existing bucket instead of failing.
+
+    stmt is an INSERT into HoursRollup, e.g. with from_select(); by default
+    a plain one for executemany.
+    """
+    if stmt is None:
+        stmt = sqlite_insert(HoursRollup.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=['period', 'bucket_start', 'user_id', 'project_id'],
+        set_={'hours': HoursRollup.__table__.c.hours + stmt.excluded.hours}
+    )
+
+
+def add_to_rollups(entries):
+    """Add approved hours to the rollups (negative hours take them off).
+
+    entries is an iterable of (user_id, project_id, log_date, hours); all
+    changes are summed per bucket and written with one executemany.
+    """
+    totals = {}
+    for user_id, project_id, log_date, hours in entries:
+        if log_date is None or not hours:
+            continue
+        for period in ROLLUP_PERIODS:
+            key = (period, bucket_start(period, log_date), int(user_id), int(project_id or 0))
+            totals[key] = totals.get(key, 0.0) + hours
+    if totals:
+        db.session.execute(rollup_upsert(), [
+            {'period': period, 'bucket_start': start, 'user_id': user_id,
+             'project_id': project_id, 'hours': hours}
+            for (period, start, user_id, project_id), hours in totals.items()
+        ])
+
+
+def rollup_time_logs(conditions, table=None):
+    """Add the hours of all TimeLogs matching conditions to the rollups, in SQL.
+
+    With table, the logs are read from that (archive) table instead.
+    """
+    columns = (TimeLog.__table__ if table is None else table).c
+    starts = {
+        'day': db.func.date(columns.log_date),
+        'week': db.func.date(columns.log_date, '-6 days', 'weekday 1'),
+        'month': db.func.date(columns.log_date, 'start of month'),
+    }
+    project_id = db.func.coalesce(columns.project_id, 0)
+    for period, start in starts.items():
+        select = db.select(
+                db.literal(period), start, columns.user_id, project_id,
+                db.func.coalesce(db.func.sum(columns.hours), 0.0)
+            )\
+            .where(columns.log_date.isnot(None), *conditions)\
+            .group_by(start, columns.user_id, project_id)
+        db.session.execute(rollup_upsert(sqlite_insert(HoursRollup.__table__).from_select(
+            ['period', 'bucket_start', 'user_id', 'project_id', 'hours'], select
+        )))
+
+
+def rebuild_rollups():
+    """Throw away the rollups and rebuild them from the approved TimeLogs,
+    archived ones included."""
+    db.session.execute(db.delete(HoursRollup))
+    for table in time_log_tables():
+        rollup_time_logs([table.c.approved == True], table)
+    db.session.commit()
+
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the day / week / month hour rollups from TimeLog."""
+    rebuild_rollups()
+    print("Hour rollups rebuilt from TimeLog.")
+
+
+def rollup_report(period, group_by, date_from=None, date_to=None, user_id=None, project_id=None):
+    """Approved hours per bucket, from the rollups only.
+
+    group_by is 'total', 'user', 'project' or 'user_project'. date_from and
+    date_to select whole buckets: date_from is moved back to the start of
+    its bucket. Returns a list of (bucket_start, user, project, hours) with
+    user / project None when not grouped by them.
+    """
+    by_user = group_by in ('user', 'user_project')
+    by_project = group_by in ('project', 'user_project')
+    group = [HoursRollup.bucket_start]
+    if by_user:
+        group.append(HoursRollup.user_id)
+    if by_project:
+        group.append(HoursRollup.project_id)
+
+    query = db.select(*group, db.func.sum(HoursRollup.hours).label('hours'))\
+        .where(HoursRollup.period == period)\
+        .group_by(*group)\
+        .order_by(*group)
+    if date_from:
+        query = query.where(HoursRollup.bucket_start >= bucket_start(period, date_from))
+    if date_to:
+        query = query.where(HoursRollup.bucket_start <= date_to)
+    if user_id:
+        query = query.where(HoursRollup.user_id == user_id)
+    if project_id:
+        query = query.where(HoursRollup.project_id == project_id)
+    rows = db.session.execute(query).all()
+
+    # Look up the users / projects that appear in the result in one query each
+    users, projects = {}, {}
+    if by_user and rows:
+        ids = {row.user_id for row in rows}
+        users = {u.id: u for u in User.query.filter(User.id.in_(ids))}
+    if by_project and rows:
+        ids = {row.project_id for row in rows}
+        projects = {p.id: p for p in Project.query.filter(Project.id.in_(ids))}
+
+    report = []
+    for row in rows:
+        user = users.get(row.user_id) if by_user else None
+        project = projects.get(row.project_id) if by_project else None
+        report.append((row.bucket_start, user, project, row.hours))
+    return report
+
+
+# ------------------------------------------------------------------------
+# Archive: approved time logs older than ARCHIVE_AFTER_DAYS are moved out
+# of time_log into one table per year (time_log_archive_2023, ...), so the
+# dashboards and the pending queue, which only read time_log, stay small as
+# the history grows. The hours stay approved, so the counters and rollups
+# are left as they are. The payroll export and the rebuilds of the counters
+# and rollups read the archive tables too (time_log_tables()).
+#
+# Rows move in batches of ARCHIVE_BATCH_SIZE, each one INSERT ... SELECT
+# plus DELETE in its own short transaction, so the app keeps running while
+# a year is archived or restored.
+# ------------------------------------------------------------------------
+ARCHIVE_PREFIX = 'time_log_archive_'
+
+# Kept out of db.metadata so that create_all() doesn't create them
+_archive_metadata = db.MetaData()
+_archive_tables_lock = threading.Lock()
+
+
+def archive_table(year):
+    """The Table of year's archive (which may not exist in the database yet)."""
+    name = f'{ARCHIVE_PREFIX}{year}'
+    with _archive_tables_lock:
+        table = _archive_metadata.tables.get(name)
+        if table is None:
+            # Same columns as time_log; the ids are kept
+            table = db.Table(
+                name, _archive_metadata,
+                db.Column('id', db.Integer, primary_key=True),
+                db.Column('user_id', db.Integer, nullable=False),
+                db.Column('log_date', db.Date, nullable=False),
+                db.Column('hours', db.Float),
+                db.Column('approved', db.Boolean, nullable=False),
+                db.Column('project_id', db.Integer),
+                # The export reads by date, by employee or by project
+                db.Index(f'ix_{name}_date', 'log_date'),
+                db.Index(f'ix_{name}_user_date', 'user_id', 'log_date'),
+                db.Index(f'ix_{name}_project_date', 'project_id', 'log_date'),
+            )
+        return table
+
+
+def archive_years():
+    """Years that have an archive table, oldest first."""
+    names = db.session.scalars(
+        db.text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :prefix"),
+        {'prefix': ARCHIVE_PREFIX + '%'}
+    )
+    suffixes = (name[len(ARCHIVE_PREFIX):] for name in names)
+    return sorted(int(suffix) for suffix in suffixes if suffix.isdigit())
+
+
+def time_log_tables():
+    """time_log followed by all archive tables."""
+    return [TimeLog.__table__] + [archive_table(year) for year in archive_years()]
+
+
+def archive_time_logs(before, batch_size=None):
+    """Move the approved time logs dated before `before` into the archive.
+
+    Returns the number of rows moved.
+    """
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    logs = TimeLog.__table__
+    columns = ['id', 'user_id', 'log_date', 'hours', 'approved', 'project_id']
+    moved = 0
+    while True:
+        oldest = db.session.scalar(
+            db.select(db.func.min(logs.c.log_date)).where(logs.c.approved == True, logs.c.log_date < before))
+        db.session.rollback()
+        if oldest is None:
+            return moved
+        year = oldest.year
+        table = archive_table(year)
+        table.create(bind=db.engine, checkfirst=True)
+
+        # The first batch_size archivable rows of that year. The INSERT
+        # takes the write lock, so the DELETE sees the same rows.
+        batch = db.select(logs.c.id)\
+            .where(logs.c.approved == True,
+                   logs.c.log_date >= date(year, 1, 1),
+                   logs.c.log_date < min(before, date(year + 1, 1, 1)))\
+            .order_by(logs.c.approved, logs.c.log_date, logs.c.id)\
+            .limit(batch_size)
+        while True:
+            count = db.session.execute(table.insert().from_select(
+                columns, db.select(*(logs.c[name] for name in columns)).where(logs.c.id.in_(batch))
+            )).rowcount
+            if not count:
+                db.session.rollback()
+                break
+            db.session.execute(logs.delete().where(logs.c.id.in_(batch)))
+            db.session.commit()
+            moved += count
+
+
+def restore_time_logs(year, batch_size=None):
+    """Move year's archived time logs back into time_log and drop its table.
+
+    Rows keep their id unless time_log has reused it meanwhile; those get a
+    new one. Returns the number of rows moved.
+    """
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    if year not in archive_years():
+        return 0
+    logs, table = TimeLog.__table__, archive_table(year)
+    columns = ['user_id', 'log_date', 'hours', 'approved', 'project_id']
+    moved = 0
+    while True:
+        batch = db.select(table).order_by(table.c.id).limit(batch_size).subquery()
+        taken = db.exists().where(logs.c.id == batch.c.id)
+        # Rows with a taken id (NULL: a new one) go last, after the ids
+        # they could otherwise collide with
+        count = db.session.execute(logs.insert().from_select(
+            columns + ['id'],
+            db.select(*(batch.c[name] for name in columns), db.case((taken, None), else_=batch.c.id))
+                .order_by(taken, batch.c.id)
+        )).rowcount
+        if not count:
+            break
+        db.session.execute(table.delete().where(
+            table.c.id.in_(db.select(table.c.id).order_by(table.c.id).limit(batch_size))))
+        db.session.commit()
+        moved += count
+    db.session.rollback()
+    table.drop(bind=db.engine)
+    return moved
+
+
+@bp.cli.command('archive-logs')
+@click.option('--before', type=click.DateTime(['%Y-%m-%d']),
+              help="Archive approved logs dated before this day (default: ARCHIVE_AFTER_DAYS ago).")
+@click.option('--batch-size', type=int, help="Rows per transaction (default: ARCHIVE_BATCH_SIZE).")
+def archive_logs_command(before, batch_size):
+    """Move old approved time logs into the per-year archive tables."""
+    before = before.date() if before else date.today() - timedelta(days=current_app.config['ARCHIVE_AFTER_DAYS'])
+    moved = archive_time_logs(before, batch_size)
+    print(f"Archived {moved} time logs dated before {before}.")
+
+
+@bp.cli.command('restore-logs')
+@click.argument('year', type=int)
+@click.option('--batch-size', type=int, help="Rows per transaction (default: ARCHIVE_BATCH_SIZE).")
+def restore_logs_command(year, batch_size):
+    """Move the archived time logs of YEAR back into time_log."""
+    moved = restore_time_logs(year, batch_size)
+    print(f"Restored {moved} time logs of {year}.")
+
+
+# ------------------------------------------------------------------------
+# Deleting employees and projects, set-based. The caller chooses what
+# happens to the time logs of the deleted employee / project (the "owner"):
+#   archive   approved logs move to the archive tables and their hours stay
+#             counted; pending logs are deleted
+#   reassign  all logs, hours, rollups and project assignments go to another
+#             employee / project
+#   delete    the logs are deleted and their approved hours are taken off
+#             the other side's counters and the rollups
+# Each step is one statement per table, using the user_id / project_id
+# indexes; nothing is loaded as ORM objects. (SQLite doesn't enforce the
+# foreign keys here, so this is the ON DELETE behaviour.) The caller commits.
+# ------------------------------------------------------------------------
+DELETE_LOG_MODES = ('archive', 'reassign', 'delete')
+
+
+def delete_employee(user_id, logs='archive', reassign_to=None):
+    """Delete an employee, their project assignments and, depending on
+    logs (one of DELETE_LOG_MODES), their time logs."""
+    _delete_owner(User, 'user_id', 'project_id', user_id, logs, reassign_to)
+
+
+def delete_project(project_id, logs='archive', reassign_to=None):
+    """Delete a project, its assignments and, depending on logs (one of
+    DELETE_LOG_MODES), its time logs."""
+    _delete_owner(Project, 'project_id', 'user_id', project_id, logs, reassign_to)
+
+
+def _delete_owner(model, column, other_column, owner_id, mode, target_id):
+    if mode not in DELETE_LOG_MODES:
+        raise ValueError(f"Unknown mode for the time logs: {mode}")
+    if mode == 'reassign' and (target_id is None or target_id == owner_id
+                               or db.session.get(model, target_id) is None):
+        raise ValueError("Choose another existing one to reassign the time logs to.")
+    counter = User.hours_worked if model is User else Project.total_hours
+    logs, rollups = TimeLog.__table__, HoursRollup.__table__
+
+    if mode == 'reassign':
+        db.session.execute(sqlite_insert(employee_projects).from_select(
+            [column, other_column],
+            db.select(db.literal(target_id), employee_projects.c[other_column])
+                .where(employee_projects.c[column] == owner_id)
+        ).on_conflict_do_nothing())
+    db.session.execute(employee_projects.delete().where(employee_projects.c[column] == owner_id))
+
+    if mode == 'reassign':
+        approved_hours = sum(
+            db.select(db.func.coalesce(db.func.sum(table.c.hours), 0.0))
+                .where(table.c[column] == owner_id, table.c.approved == True)
+                .scalar_subquery()
+            for table in time_log_tables()
+        )
+        db.session.execute(db.update(model).where(model.id == target_id)
+                           .values({counter: db.func.coalesce(counter, 0.0) + approved_hours}))
+        # Add the owner's rollup buckets to the target's
+        columns = ['period', 'bucket_start', 'user_id', 'project_id', 'hours']
+        values = {name: rollups.c[name] for name in columns}
+        values[column] = db.literal(target_id)
+        db.session.execute(rollup_upsert(sqlite_insert(rollups).from_select(
+            columns, db.select(*(values[name] for name in columns)).where(rollups.c[column] == owner_id))))
+        db.session.execute(rollups.delete().where(rollups.c[column] == owner_id))
+        for table in time_log_tables():
+            db.session.execute(table.update().where(table.c[column] == owner_id).values({column: target_id}))
+
+    elif mode == 'archive':
+        first, last = db.session.execute(
+            db.select(db.func.min(logs.c.log_date), db.func.max(logs.c.log_date))
+                .where(logs.c[column] == owner_id, logs.c.approved == True)
+        ).one()
+        columns = ['id', 'user_id', 'log_date', 'hours', 'approved', 'project_id']
+        years = range(first.year, last.year + 1) if first else []
+        for year in years:
+            table = archive_table(year)
+            table.create(bind=db.session.connection(), checkfirst=True)
+            db.session.execute(table.insert().from_select(
+                columns,
+                db.select(*(logs.c[name] for name in columns))
+                    .where(logs.c[column] == owner_id, logs.c.approved == True,
+                           logs.c.log_date >= date(year, 1, 1), logs.c.log_date < date(year + 1, 1, 1))
+            ))
+        db.session.execute(logs.delete().where(
+            logs.c[column] == owner_id, logs.c.approved == True, logs.c.log_date.isnot(None)))
+        # Only pending (and undated) logs are left
+        _delete_time_logs([logs], column, other_column, owner_id)
+
+    else:
+        _delete_time_logs(time_log_tables(), column, other_column, owner_id)
+        db.session.execute(rollups.delete().where(rollups.c[column] == owner_id))
+
+    db.session.execute(db.delete(model).where(model.id == owner_id))
+
+
+def _delete_time_logs(tables, column, other_column, owner_id):
+    """Delete the owner's logs from tables, taking their approved hours off
+    the counters of the employees / projects on the other side."""
+    for table in tables:
+        approved = [table.c[column] == owner_id, table.c.approved == True]
+        hours = dict(db.session.execute(
+            db.select(table.c[other_column], db.func.sum(table.c.hours))
+                .where(*approved, table.c[other_column].isnot(None))
+                .group_by(table.c[other_column])
+        ).all())
+        deltas = {other_id: -total for other_id, total in hours.items() if total}
+        if other_column == 'user_id':
+            adjust_approved_hours_many(deltas, {})
+        else:
+            adjust_approved_hours_many({}, deltas)
+        db.session.execute(table.delete().where(table.c[column] == owner_id))
+
+
+# ------------------------------------------------------------------------
+# Project assignments: employee_projects rows are changed set-based. The
+# wanted assignments are diffed against the current ones and only the rows
+# that differ are inserted or deleted, each kind with one executemany.
+# ------------------------------------------------------------------------
+ASSIGN_MODES = ('set', 'add', 'remove')
+
+
+def assign_projects(user_ids, project_ids, mode='set'):
+    """Change the project assignments of many employees at once.
+
+    mode 'set' makes project_ids the exact project list of every user,
+    'add' adds them to what each user already has and 'remove' takes them
+    off. Unknown user or project ids are ignored. Doesn't commit; returns
+    (rows added, rows removed).
+    """
+    if mode not in ASSIGN_MODES:
+        raise ValueError(f"Unknown assignment mode: {mode}")
+    user_ids = set(user_ids)
+    project_ids = set(project_ids)
+    # One IN lookup each to drop ids that don't exist
+    if user_ids:
+        user_ids = set(db.session.scalars(db.select(User.id).where(User.id.in_(user_ids))))
+    if project_ids:
+        project_ids = set(db.session.scalars(db.select(Project.id).where(Project.id.in_(project_ids))))
+    if not user_ids:
+        return 0, 0
+
+    current = set(db.session.execute(
+        db.select(employee_projects.c.user_id, employee_projects.c.project_id)
+            .where(employee_projects.c.user_id.in_(user_ids))
+    ).tuples())
+    requested = {(u, p) for u in user_ids for p in project_ids}
+    if mode == 'set':
+        to_add, to_remove = requested - current, current - requested
+    elif mode == 'add':
+        to_add, to_remove = requested - current, set()
+    else:
+        to_add, to_remove = set(), requested & current
+
+    if to_add:
+        db.session.execute(employee_projects.insert(),
+                           [{'user_id': u, 'project_id': p} for u, p in to_add])
+    if to_remove:
+        db.session.execute(
+            employee_projects.delete().where(
+                employee_projects.c.user_id == db.bindparam('u'),
+                employee_projects.c.project_id == db.bindparam('p')),
+            [{'u': u, 'p': p} for u, p in to_remove]
+        )
+    # Collections already loaded in the session are now out of date
+    changed_users = {u for u, _ in to_add | to_remove}
+    changed_projects = {p for _, p in to_add | to_remove}
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, User) and obj.id in changed_users:
+            db.session.expire(obj, ['projects'])
+        elif isinstance(obj, Project) and obj.id in changed_projects:
+            db.session.expire(obj, ['users'])
+    return len(to_add), len(to_remove)
+
+
+# ------------------------------------------------------------------------
+# Keyset pagination for time log lists: pages are cut on (log_date, id)
+# so fetching page 1000 costs the same as fetching page 1 (no OFFSET).
+# A cursor looks like "2025-01-14.42" (date and id of the last row shown).
+# ------------------------------------------------------------------------
+def parse_cursor(value):
+    """Turn a cursor string into a (date, id) tuple, or None if missing/invalid."""
+    if not value:
+        return None
+    try:
+        date_str, id_str = value.split('.')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(id_str)
+    except ValueError:
+        return None
+
+
+def keyset_page(query, cursor, per_page, descending=True):
+    """Return (logs, next_cursor) for one page of a TimeLog query.
+
+    next_cursor is None when there are no more rows after this page.
+    """
+    key = db.tuple_(TimeLog.log_date, TimeLog.id)
+    if descending:
+        query = query.order_by(TimeLog.log_date.desc(), TimeLog.id.desc())
+    else:
+        query = query.order_by(TimeLog.log_date.asc(), TimeLog.id.asc())
+    if cursor:
+        last = db.tuple_(*cursor)
+        query = query.filter(key < last if descending else key > last)
+
+    # Fetch one extra row to find out whether there is a next page
+    logs = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(logs) > per_page:
+        logs = logs[:per_page]
+        last_log = logs[-1]
+        next_cursor = f"{last_log.log_date.isoformat()}.{last_log.id}"
+    return logs, next_cursor
+
+
+def id_page(query, model, after, per_page):
+    """Return (rows, next_after) for one page of query ordered by model.id.
+
+    after is the last id of the previous page (a string from the query
+    string is fine); next_after is None on the last page.
+    """
+    query = query.order_by(model.id)
+    if after and str(after).isdigit():
+        query = query.filter(model.id > int(after))
+    rows = query.limit(per_page + 1).all()
+    next_after = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_after = rows[-1].id
+    return rows, next_after
+
+
+# ------------------------------------------------------------------------
+# Search: SQLite FTS5 indexes over employee names and project names /
+# descriptions. They are "external content" tables (they store only the
+# index, the text stays in user / project) kept in sync by triggers, so
+# every insert, update and delete is covered, ORM or not. Updates that
+# don't touch the indexed columns (e.g. the hour counters) skip them.
+# Prefix indexes on 2, 3 and 4 characters make typeahead lookups cheap.
+# ------------------------------------------------------------------------
+SEARCH_INDEXES = {
+    # index table: (content table, indexed columns)
+    'user_fts': ('user', ('username', 'first_name', 'last_name')),
+    'project_fts': ('project', ('name', 'description')),
+}
+# Only this many matches are ranked. A short prefix can match most of the
+# table, and ranking all of it would take far longer than a keystroke; the
+# longer the search text gets, the fewer matches and the better the ranking.
+SEARCH_CANDIDATES = 500
+
+
+def create_search_index():
+    """Create the FTS tables and their triggers if missing (called by
+    upgrade_db); a newly created index is filled from the existing rows."""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as conn:
+        for fts, (table, columns) in SEARCH_INDEXES.items():
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)
+            ).first()
+            cols = ', '.join(columns)
+            new_cols = ', '.join(f'new.{c}' for c in columns)
+            old_cols = ', '.join(f'old.{c}' for c in columns)
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"{cols}, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+            )
+            conn.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON "{table}" BEGIN '
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+            )
+            conn.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON "{table}" BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+            )
+            conn.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {cols} ON "{table}" BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+            )
+            if not exists:
+                conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def rebuild_search_index():
+    """Rebuild the search indexes from the user and project tables."""
+    with db.engine.begin() as conn:
+        for fts in SEARCH_INDEXES:
+            conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+@bp.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the employee / project search indexes."""
+    rebuild_search_index()
+    print("Search indexes rebuilt.")
+
+
+def search_match_query(text):
+    """Turn what the user typed into an FTS5 query: every word must match
+    as the start of a word (so "ann ba" finds "Anna Bakker").
+
+    Words are quoted, so FTS5 operators and punctuation can't break the query.
+    Single letters are left out (the prefix indexes start at two). Returns
+    None if there is nothing to search for.
+    """
+    words = [word for word in ''.join(ch if ch.isalnum() else ' ' for ch in text).split()
+             if len(word) > 1]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(text, limit=10):
+    """Best matching employees and projects for text, as two lists of dicts."""
+    match = search_match_query(text)
+    if match is None:
+        return {'employees': [], 'projects': []}
+    params = {'match': match, 'limit': limit, 'candidates': SEARCH_CANDIDATES}
+    # bm25() ranks the better matches first (lower is better)
+    employees = db.session.execute(db.text(
+        "SELECT u.id, u.username, u.first_name, u.last_name, u.role FROM ("
+        "  SELECT rowid, bm25(user_fts) AS score FROM user_fts"
+        "  WHERE user_fts MATCH :match LIMIT :candidates"
+        ") m JOIN user u ON u.id = m.rowid ORDER BY m.score LIMIT :limit"
+    ), params).mappings().all()
+    projects = db.session.execute(db.text(
+        "SELECT p.id, p.name, p.description FROM ("
+        "  SELECT rowid, bm25(project_fts) AS score FROM project_fts"
+        "  WHERE project_fts MATCH :match LIMIT :candidates"
+        ") m JOIN project p ON p.id = m.rowid ORDER BY m.score LIMIT :limit"
+    ), params).mappings().all()
+    return {'employees': [dict(row) for row in employees],
+            'projects': [dict(row) for row in projects]}
+
+
+# ------------------------------------------------------------------------
+# Bulk import of time logs from CSV or JSON-lines files. Rows are read one
+# at a time, checked against the known user / project ids and inserted in
+# executemany batches, so memory stays bounded whatever the file size.
+# Columns: user_id, project_id, log_date (YYYY-MM-DD), hours, approved
+# ------------------------------------------------------------------------
+def read_csv_rows(stream):
+    """Yield one dict per line of a CSV file with a header row."""
+    return csv.DictReader(stream)
+
+
+def read_jsonl_rows(stream):
+    """Yield one dict per non-empty line of a JSON-lines file."""
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Let import_time_logs() count it as a rejected row
+                yield None
+
+
+def parse_import_row(row, user_ids, project_ids):
+    """Validate one imported row and return the values to insert.
+
+    Raises ValueError with a short reason if the row is not valid.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("not a valid record")
+    try:
+        user_id = int(row['user_id'])
+        project_id = row.get('project_id')
+        project_id = int(project_id) if project_id not in (None, '') else None
+        log_date = date.fromisoformat(str(row['log_date']).strip())
+        hours = float(row['hours'])
+    except KeyError as e:
+        raise ValueError(f"missing column {e}")
+    except (TypeError, ValueError):
+        raise ValueError("badly formatted value")
+
+    if user_id not in user_ids:
+        raise ValueError(f"unknown user {user_id}")
+    if project_id is not None and project_id not in project_ids:
+        raise ValueError(f"unknown project {project_id}")
+    if not math.isfinite(hours):
+        raise ValueError("hours must be a number")
+    if hours < 0:
+        raise ValueError("negative hours")
+
+    approved = row.get('approved', False)
+    if isinstance(approved, str):
+        approved = approved.strip().lower() in ('1', 'true', 'yes', 'y')
+
+    return {
+        'user_id': user_id,
+        'project_id': project_id,
+        'log_date': log_date,
+        'hours': hours,
+        'approved': bool(approved),
+    }
+
+
+def import_time_logs(rows, batch_size=None, max_errors=20, skip=0, checkpoint=None):
+    """Insert TimeLogs from an iterable of row dicts.
+
+    Each batch is inserted with a single executemany and committed together
+    with its approved-hour counter updates. Returns a dict with the number
+    of accepted and rejected rows and the first few rejection reasons.
+
+    For background jobs: the first skip rows are passed over (an earlier run
+    already imported them) and checkpoint(rows_read) is called inside each
+    batch's transaction, so the position is saved together with the rows.
+    """
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    # Lookup sets of valid ids (one small integer per user / project)
+    user_ids = set(db.session.scalars(db.select(User.id)))
+    project_ids = set(db.session.scalars(db.select(Project.id)))
+    insert = TimeLog.__table__.insert()
+
+    result = {'accepted': 0, 'rejected': 0, 'errors': []}
+    batch = []
+    rows_read = skip
+
+    def flush():
+        db.session.execute(insert, batch)
+        # Sum approved hours per user / project so the counters move once per
+        # batch, and the same for the rollup buckets
+        user_hours, project_hours = {}, {}
+        for values in batch:
+            if values['approved']:
+                user_hours[values['user_id']] = user_hours.get(values['user_id'], 0.0) + values['hours']
+                if values['project_id'] is not None:
+                    project_hours[values['project_id']] = project_hours.get(values['project_id'], 0.0) + values['hours']
+        adjust_approved_hours_many(user_hours, project_hours)
+        add_to_rollups(
+            (values['user_id'], values['project_id'], values['log_date'], values['hours'])
+            for values in batch if values['approved']
+        )
+        if checkpoint:
+            checkpoint(rows_read)
+        db.session.commit()
+        result['accepted'] += len(batch)
+        batch.clear()
+
+    for line_no, row in enumerate(rows, start=1):
+        if line_no <= skip:
+            continue
+        rows_read = line_no
+        try:
+            batch.append(parse_import_row(row, user_ids, project_ids))
+        except ValueError as e:
+            result['rejected'] += 1
+            if len(result['errors']) < max_errors:
+                result['errors'].append(f"row {line_no}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+# ------------------------------------------------------------------------
+# Payroll export: approved time logs joined with their user and project,
+# read in batches from one query and streamed out as CSV while they are
+# fetched, so memory stays flat however many rows the period has.
+# ------------------------------------------------------------------------
+EXPORT_COLUMNS = ['log_id', 'log_date', 'user_id', 'username', 'first_name',
+                  'last_name', 'project_id', 'project', 'hours']
+
+
+def iter_export_rows(filters, batch_size=None):
+    """Yield approved TimeLog rows (as tuples in EXPORT_COLUMNS order),
+    archived ones included, by date.
+
+    filters is the request data understood by time_log_filters().
+    """
+    batch_size = batch_size or current_app.config['EXPORT_BATCH_SIZE']
+    streams = []
+    for table in time_log_tables():
+        query = db.select(
+                table.c.id, table.c.log_date, User.id, User.username, User.first_name,
+                User.last_name, Project.id, Project.name, table.c.hours
+            )\
+            .outerjoin(User, table.c.user_id == User.id)\
+            .outerjoin(Project, table.c.project_id == Project.id)\
+            .where(table.c.approved == True, *time_log_filters(filters, table))\
+            .order_by(table.c.log_date, table.c.id)\
+            .execution_options(yield_per=batch_size)
+        partitions = db.session.execute(query).partitions()
+        streams.append(row for partition in partitions for row in partition)
+    # Each table is read in (log_date, id) order already; merge them
+    yield from heapq.merge(*streams, key=lambda row: (row[1], row[0]))
+
+
+def count_export_rows(filters):
+    """Number of rows iter_export_rows(filters) yields."""
+    return sum(
+        db.session.scalar(
+            db.select(db.func.count()).select_from(table)
+                .where(table.c.approved == True, *time_log_filters(filters, table)))
+        for table in time_log_tables()
+    )
+
+
+def iter_export_csv(rows, rows_per_chunk=1000):
+    """Turn export rows into CSV text, yielded a chunk of lines at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
 # ------------------------------------------------------------------------
 # Decorators
 # ------------------------------------------------------------------------
@@ -102,44 +1473,1062 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash("Please log in first.", "warning")
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
     return decorated_function
 
+def query_budget(max_queries):
+    """Declares how many SQL statements one request to the route may issue.
+
+    Doesn't change the route; check_query_budget.py renders the routes and
+    fails if one goes over its budget (e.g. because of a lazy-load N+1).
+    """
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
 def admin_required(f):
     """Checks if user is admin."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session or session.get('role') != 'admin':
             flash("Admin access required.", "danger")
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
     return decorated_function
 
 # ------------------------------------------------------------------------
-# Before first request, create tables and an admin user
+# Instrumentation: per-endpoint request latency histograms, SQL statement
+# counts and time, and template render time, served in Prometheus text
+# format on /metrics. Every thread adds to its own set of counters (no
+# lock on the hot path); /metrics adds the threads' counters together.
+# When a thread ends, its counters are folded into a shared total, so the
+# threaded server (one thread per request) doesn't pile them up.
+# Statements slower than SLOW_QUERY_MS are logged with their route.
 # ------------------------------------------------------------------------
-app_initialized = False
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    """Counters for one endpoint, owned by a single thread."""
+    __slots__ = ('buckets', 'count', 'seconds', 'sql_count', 'sql_seconds', 'render_seconds')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+
+    def add(self, other):
+        """Add the counters of other to these."""
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.seconds += other.seconds
+        self.sql_count += other.sql_count
+        self.sql_seconds += other.sql_seconds
+        self.render_seconds += other.render_seconds
+
+
+class _ThreadToken:
+    """Kept in a thread's threading.local; freed when the thread ends."""
+    __slots__ = ('__weakref__',)
+
+
+class Metrics:
+    """Request metrics kept per thread and added together when read."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        # The counters of the threads that have ended
+        self._retired = {}
+        self.slow_queries = 0
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # Only taken once per thread
+            shard = self._local.shard = {}
+            self._local.token = token = _ThreadToken()
+            weakref.finalize(token, self._retire, shard)
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _retire(self, shard):
+        """Fold the shard of a thread that has ended into the shared total."""
+        with self._shards_lock:
+            self._shards.remove(shard)
+            for endpoint, stats in shard.items():
+                total = self._retired.get(endpoint)
+                if total is None:
+                    total = self._retired[endpoint] = EndpointStats()
+                total.add(stats)
+
+    def observe(self, endpoint, seconds, sql_count, sql_seconds, render_seconds):
+        """Record one finished request."""
+        shard = self._shard()
+        stats = shard.get(endpoint)
+        if stats is None:
+            stats = shard[endpoint] = EndpointStats()
+        stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats.count += 1
+        stats.seconds += seconds
+        stats.sql_count += sql_count
+        stats.sql_seconds += sql_seconds
+        stats.render_seconds += render_seconds
+
+    def count_slow_query(self):
+        # Rare, so a lock is fine here
+        with self._shards_lock:
+            self.slow_queries += 1
+
+    def totals(self):
+        """Return {endpoint: EndpointStats} added up over all threads."""
+        totals = {}
+        with self._shards_lock:
+            # Together, so that a thread ending meanwhile isn't missed or
+            # counted twice
+            shards = [self._retired] + [shard.copy() for shard in self._shards]
+            for shard in shards:
+                for endpoint, stats in shard.items():
+                    total = totals.get(endpoint)
+                    if total is None:
+                        total = totals[endpoint] = EndpointStats()
+                    total.add(stats)
+        return totals
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        totals = self.totals()
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for endpoint, stats in sorted(totals.items()):
+            label = f'endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+                cumulative += n
+                lines.append(f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{label}}} {stats.seconds:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{label}}} {stats.count}')
+
+        for name, attr, help_text in (
+            ('sql_statements_total', 'sql_count', 'SQL statements executed, by endpoint.'),
+            ('sql_duration_seconds_total', 'sql_seconds', 'Time spent in SQL, by endpoint.'),
+            ('template_render_seconds_total', 'render_seconds', 'Time spent rendering templates, by endpoint.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, stats in sorted(totals.items()):
+                value = getattr(stats, attr)
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+        lines.append('# HELP sql_slow_queries_total Statements slower than SLOW_QUERY_MS.')
+        lines.append('# TYPE sql_slow_queries_total counter')
+        lines.append(f'sql_slow_queries_total {self.slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's own context, which goes away with it even if the
+    # statement fails (after_cursor_execute then never runs). A few internal
+    # statements of the dialect have no context; they aren't timed.
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def _after_cursor_execute(app, conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    in_request = has_request_context()
+    if in_request and 'request_started' in g:
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        metrics.count_slow_query()
+        route = request.endpoint if in_request else None
+        app.logger.warning("Slow query (%.1f ms) in %s: %s",
+                           elapsed * 1000, route or 'no request', ' '.join(statement.split()))
+
+
+@before_render_template.connect
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.render_started = time.perf_counter()
+
+
+@template_rendered.connect
+def _after_render(sender, template, context, **extra):
+    if has_request_context() and 'render_started' in g:
+        g.render_seconds += time.perf_counter() - g.pop('render_started')
+
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+    g.render_seconds = 0.0
+
+
+@bp.teardown_app_request
+def record_request_metrics(exc):
+    if 'request_started' in g:
+        metrics.observe(
+            request.endpoint or 'unmatched',
+            time.perf_counter() - g.request_started,
+            g.sql_count,
+            g.sql_seconds,
+            g.render_seconds
+        )
+
+
+@bp.route('/metrics')
+@admin_required
+def metrics_endpoint():
+    """Prometheus metrics (admins only)."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# ------------------------------------------------------------------------
+# Page cache: rendered pages are kept in memory, keyed by URL and the
+# global data version (DataVersion). Any commit that writes data bumps the
+# version, so cached pages can never be stale; old entries simply age out
+# of the LRU. Responses carry an ETag / Last-Modified so browsers that
+# already have the page get a 304 without anything being rendered.
+# ------------------------------------------------------------------------
+@event.listens_for(SASession, 'after_flush')
+def _mark_flushed_changes(session, flush_context):
+    session.info['data_changed'] = True
+
+
+@event.listens_for(SASession, 'do_orm_execute')
+def _mark_bulk_changes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['data_changed'] = True
+
+
+@event.listens_for(SASession, 'before_commit')
+def _bump_data_version(session):
+    # Also catch changes that are still waiting to be flushed by this commit
+    if session.info.get('data_changed') or session.new or session.dirty or session.deleted:
+        session.execute(
+            db.update(DataVersion)
+                .where(DataVersion.id == 1)
+                .values(version=DataVersion.version + 1, changed_at=datetime.utcnow())
+        )
+        session.info.pop('data_changed', None)
+
+
+def current_data_version():
+    """Return (version, changed_at) of the data, read straight from the database."""
+    row = db.session.execute(
+        db.select(DataVersion.version, DataVersion.changed_at).where(DataVersion.id == 1)
+    ).first()
+    return (row.version, row.changed_at) if row else (0, None)
+
+
+class PageCache:
+    """Thread-safe LRU of rendered pages, bounded by entry count and size."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def size(entry):
+        # The body, and its gzipped copy if there is one
+        return len(entry[0]) + len(entry[3] or b'')
+
+    def put(self, key, entry):
+        if self.size(entry) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self.size(old)
+            self._entries[key] = entry
+            self._bytes += self.size(entry)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self.size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def cached_page(f=None, flashes=True):
+    """Serve a GET page from the app's PageCache while the data version is unchanged.
+
+    Pages with flashed messages are neither served from nor stored in the
+    cache, since the messages belong to one particular response. Fragments
+    that don't show flashed messages use @cached_page(flashes=False).
+    Large pages are gzipped once, when stored, rather than on every hit.
+    """
+    if f is None:
+        return lambda f: cached_page(f, flashes)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        version, changed_at = current_data_version()
+        key = (request.endpoint, request.full_path, version)
+        use_cache = not (flashes and session.get('_flashes'))
+
+        page_cache = current_app.extensions['page_cache']
+        entry = page_cache.get(key) if use_cache else None
+        if entry is None:
+            response = current_app.make_response(f(*args, **kwargs))
+            if not use_cache or response.status_code != 200:
+                return response
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            gzipped = gzip_body(body) if should_compress(body, response.mimetype) else None
+            entry = (body, response.mimetype, etag, gzipped)
+            page_cache.put(key, entry)
+
+        body, mimetype, etag, gzipped = entry
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        if gzipped is not None:
+            response.vary.add('Accept-Encoding')
+            if accepts_gzip():
+                set_gzipped_body(response, gzipped)
+        if changed_at:
+            response.last_modified = changed_at
+        # Always ask before reusing: the page changes whenever the data does
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    return decorated_function
+
+
+# ------------------------------------------------------------------------
+# Read snapshot (READ_SNAPSHOT): long reads (reports, the payroll export,
+# /api/summary) run on a copy of the database taken with SQLite's online
+# backup API, through their own connections. They never hold a read
+# transaction or a pooled connection of the live database, so time entry
+# is not slowed down by them. The copy is replaced when it is older than
+# READ_SNAPSHOT_MAX_AGE (in the background; the old copy is used meanwhile)
+# and every response read from it says how old it is (X-Data-As-Of).
+# ------------------------------------------------------------------------
+class ReadSnapshot:
+    """The snapshot file of one app, shared by all its processes."""
+
+    def __init__(self, app, path, max_age):
+        if fcntl is None:
+            raise RuntimeError("READ_SNAPSHOT needs fcntl, which this platform doesn't have.")
+        self.app = app
+        self.path = path
+        self.max_age = max_age
+        # A new connection per use: it opens whichever copy is current
+        self.engine = create_engine('sqlite://', creator=self._connect, poolclass=NullPool)
+        configure_engine(app, self.engine)
+
+    def _connect(self):
+        uri = pathlib.Path(self.path).as_uri() + '?mode=ro'
+        return sqlite3.connect(uri, uri=True, factory=SnapshotConnection, check_same_thread=False)
+
+    def as_of(self):
+        """When the snapshot was taken (UTC), or None if there is none yet."""
+        try:
+            return datetime.utcfromtimestamp(os.stat(self.path).st_mtime)
+        except FileNotFoundError:
+            return None
+
+    def is_stale(self):
+        as_of = self.as_of()
+        return as_of is None or (datetime.utcnow() - as_of).total_seconds() > self.max_age
+
+    def current(self):
+        """Return as_of() of the snapshot to read now.
+
+        The first snapshot is taken right away; a stale one is replaced in
+        the background, by only one thread of one process at a time.
+        """
+        if self.as_of() is None:
+            lock = self._lock(blocking=True)
+            try:
+                if self.as_of() is None:
+                    self.refresh()
+            finally:
+                os.close(lock)
+        elif self.is_stale():
+            lock = self._lock(blocking=False)
+            if lock is not None:
+                threading.Thread(target=self._refresh_in_background, args=(lock,), daemon=True).start()
+        return self.as_of()
+
+    def refresh(self):
+        """Copy the live database to the snapshot file (in an app context)."""
+        partial = f'{self.path}.{os.getpid()}.part'
+        taken_at = time.time()
+        source = db.engine.raw_connection()
+        try:
+            target = sqlite3.connect(partial)
+            try:
+                # In one step: a backup done in steps starts over whenever
+                # the database is written to in between
+                source.driver_connection.backup(target)
+                # Readers of a WAL database need to write its -shm file
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+            os.utime(partial, (taken_at, taken_at))
+            # Readers that have the old copy open keep reading it
+            os.replace(partial, self.path)
+        finally:
+            source.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def _refresh_in_background(self, lock):
+        try:
+            with self.app.app_context():
+                # Someone may have refreshed it since it was found stale
+                if self.is_stale():
+                    self.refresh()
+        except Exception:
+            self.app.logger.exception("Could not refresh the read snapshot")
+        finally:
+            os.close(lock)
+
+    def _lock(self, blocking):
+        """Return the fd holding the refresh lock, or None if it is taken."""
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+
+def use_read_snapshot():
+    """Send the reads of the rest of this request (or job) to the read
+    snapshot, if READ_SNAPSHOT is on. Returns when the data was read (UTC),
+    None when it is the live database."""
+    snapshot = current_app.extensions.get('read_snapshot')
+    if snapshot is None:
+        return None
+    g.data_as_of = snapshot.current()
+    g.read_snapshot_engine = snapshot.engine
+    return g.data_as_of
+
+
+def snapshot_reads(f):
+    """Route decorator: the view reads from the read snapshot (see
+    use_read_snapshot). Put it after the access checks."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        use_read_snapshot()
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@bp.after_app_request
+def _add_data_as_of(response):
+    if g.get('data_as_of'):
+        response.headers['X-Data-As-Of'] = g.data_as_of.isoformat(timespec='seconds') + 'Z'
+    return response
+
+
+@bp.teardown_app_request
+def _stop_snapshot_reads(exc):
+    # g belongs to the app context, which can outlive the request (tests)
+    g.pop('read_snapshot_engine', None)
+    g.pop('data_as_of', None)
+
+
+@bp.cli.command('refresh-snapshot')
+def refresh_snapshot_command():
+    """Take a new read snapshot now (e.g. from cron)."""
+    snapshot = current_app.extensions.get('read_snapshot')
+    if snapshot is None:
+        raise click.ClickException("READ_SNAPSHOT is off.")
+    lock = snapshot._lock(blocking=True)
+    try:
+        snapshot.refresh()
+    finally:
+        os.close(lock)
+    print(f"Read snapshot taken: {snapshot.path}")
+
+
+# ------------------------------------------------------------------------
+# Static assets and compression. The build step (`flask build-assets`, also
+# run by serve.py) copies every static file to static/dist under a name
+# with a hash of its content, plus gzip (and with the brotli package, also
+# brotli) versions of the text files. Templates link them with asset_url();
+# a new content gets a new URL, so browsers may cache them for good.
+# Pages and JSON are gzipped as they are sent instead (compress_response).
+# ------------------------------------------------------------------------
+ASSETS_DIR = 'dist'
+ASSETS_MAX_AGE = 365 * 24 * 3600
+COMPRESS_MIMETYPES = ('text/html', 'application/json')
+# Static files worth compressing (images and fonts already are)
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.json', '.html')
+
+
+def static_files(static_folder):
+    """Names (relative to static_folder) of the static files, built copies excepted."""
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder and ASSETS_DIR in dirs:
+            dirs.remove(ASSETS_DIR)
+        for name in files:
+            yield os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+
+
+def fingerprinted_name(filename, data):
+    """css/main.css -> css/main.<hash of data>.css"""
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def load_assets(app):
+    """Map each static file to its built copy, if the current content was built."""
+    assets = {}
+    for filename in static_files(app.static_folder):
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            name = fingerprinted_name(filename, f.read())
+        if os.path.exists(os.path.join(app.static_folder, ASSETS_DIR, name)):
+            assets[filename] = name
+    return assets
+
+
+def build_assets(app):
+    """Write the fingerprinted and compressed copies of the static files
+    that don't have them yet. Returns the number of files built."""
+    built = 0
+    for filename in static_files(app.static_folder):
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            data = f.read()
+        path = os.path.join(app.static_folder, ASSETS_DIR, fingerprinted_name(filename, data))
+        if os.path.exists(path):
+            continue
+        copies = {}
+        if filename.endswith(PRECOMPRESS_EXTENSIONS):
+            copies['.gz'] = gzip.compress(data, 9, mtime=0)
+            if brotli is not None:
+                copies['.br'] = brotli.compress(data)
+        # The plain copy last: once it exists, the compressed ones do too
+        copies[''] = data
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for suffix, content in copies.items():
+            if suffix and len(content) >= len(data):
+                continue
+            with open(path + suffix + '.part', 'wb') as f:
+                f.write(content)
+            os.replace(path + suffix + '.part', path + suffix)
+        built += 1
+    app.extensions['assets'] = load_assets(app)
+    return built
+
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted, pre-compressed copies of the static files."""
+    built = build_assets(current_app)
+    print(f"Built {built} static file(s) into {os.path.join(current_app.static_folder, ASSETS_DIR)}.")
+
+
+@bp.app_template_global()
+def asset_url(filename):
+    """URL of a static file: its built copy if there is one, else the file itself."""
+    name = current_app.extensions['assets'].get(filename)
+    # In debug mode static files are edited while the server runs
+    if name is None or current_app.debug:
+        return url_for('static', filename=filename)
+    return url_for('main.asset', filename=name)
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """A built static file, pre-compressed if the client accepts that."""
+    directory = os.path.join(current_app.static_folder, ASSETS_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(directory, filename + suffix)
+        if request.accept_encodings[encoding] and path and os.path.exists(path):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype,
+                                           max_age=ASSETS_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype, max_age=ASSETS_MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def accepts_gzip():
+    return bool(request.accept_encodings['gzip'])
+
+
+def should_compress(body, mimetype):
+    return mimetype in COMPRESS_MIMETYPES and len(body) >= current_app.config['COMPRESS_MIN_SIZE']
+
+
+def gzip_body(body):
+    # mtime=0: the same body always compresses to the same bytes
+    return gzip.compress(body, current_app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def set_gzipped_body(response, gzipped):
+    response.set_data(gzipped)
+    response.headers['Content-Encoding'] = 'gzip'
+    # Another representation of the same page: the ETag still matches
+    # If-None-Match (a weak comparison), never If-Match
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+
+
+@bp.after_app_request
+def compress_response(response):
+    """Gzip a large enough HTML / JSON response if the client accepts it."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if should_compress(body, response.mimetype):
+        response.vary.add('Accept-Encoding')
+        if accepts_gzip():
+            set_gzipped_body(response, gzip_body(body))
+    return response
+
+
+# ------------------------------------------------------------------------
+# Group commit (GROUP_COMMIT): new time logs from concurrent requests are
+# handed to one writer thread, which inserts whatever has arrived within
+# GROUP_COMMIT_WINDOW_MS (up to GROUP_COMMIT_MAX_BATCH rows) in a single
+# transaction. Each request waits until the transaction holding its row has
+# committed, so a "logged" answer still means the row is on disk, but a
+# burst of submissions costs one commit (and one fsync) per batch instead
+# of one per row, and the requests no longer queue up for SQLite's lock.
+# ------------------------------------------------------------------------
+class GroupCommitWriter:
+    """Batches TimeLog inserts from many threads into shared commits."""
+
+    def __init__(self, app, window_ms, max_batch, synchronous):
+        if synchronous and synchronous.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"Unknown GROUP_COMMIT_SYNCHRONOUS: {synchronous}")
+        self.app = app
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self._conn = None
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def insert(self, row):
+        """Insert one TimeLog row (a dict of column values); returns once
+        it has been committed, or raises what inserting it raised."""
+        future = Future()
+        self._queue.put((row, future))
+        return future.result()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # The connection itself failed: fail what is left and
+                    # start again with a new one
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    if self._conn is not None:
+                        self._conn.invalidate()
+                        self._conn.close()
+                        self._conn = None
+
+    def _write(self, batch):
+        if self._conn is None:
+            self._conn = db.engine.connect()
+            if self.synchronous:
+                self._conn.exec_driver_sql(f"PRAGMA synchronous={self.synchronous}")
+                self._conn.commit()
+        try:
+            self._commit([row for row, _ in batch])
+        except Exception:
+            self._conn.rollback()
+            # Insert the rows one by one, so only the bad ones fail
+            for row, future in batch:
+                try:
+                    self._commit([row])
+                except Exception as e:
+                    self._conn.rollback()
+                    future.set_exception(e)
+                else:
+                    future.set_result(None)
+        else:
+            for _, future in batch:
+                future.set_result(None)
+
+    def _commit(self, rows):
+        self._conn.execute(TimeLog.__table__.insert(), rows)
+        # The session hook does this for ORM commits; this is Core
+        self._conn.execute(
+            db.update(DataVersion)
+                .where(DataVersion.id == 1)
+                .values(version=DataVersion.version + 1, changed_at=datetime.utcnow())
+        )
+        self._conn.commit()
+
+
+_group_commit_writer = None
+_group_commit_lock = threading.Lock()
+
+
+def get_group_commit_writer():
+    """Return this process's group commit writer, starting it on first use."""
+    global _group_commit_writer
+    if _group_commit_writer is None:
+        with _group_commit_lock:
+            if _group_commit_writer is None:
+                config = current_app.config
+                _group_commit_writer = GroupCommitWriter(
+                    current_app._get_current_object(),
+                    config['GROUP_COMMIT_WINDOW_MS'],
+                    config['GROUP_COMMIT_MAX_BATCH'],
+                    config['GROUP_COMMIT_SYNCHRONOUS'],
+                )
+    return _group_commit_writer
+
+
+# ------------------------------------------------------------------------
+# Background jobs: exports, imports and rebuilds that take minutes run on a
+# small pool of JOB_WORKERS threads instead of inside a request. Each job is
+# a row in the Job table (status, progress, result), written on its own
+# connection so it never mixes with the job's own transaction or bumps the
+# data version. Jobs that were running when the process stopped are queued
+# again by start_job_workers(); handlers are written to be safe to re-run.
+# Jobs share the process (and the GIL) with the web requests, so they pause
+# every few dozen rows while a request is in flight.
+# ------------------------------------------------------------------------
+JOB_HANDLERS = {}
+JOB_FINISHED = ('done', 'failed', 'cancelled')
+# Rows a job handles between checks for running requests
+JOB_YIELD_EVERY = 50
+
+_job_pool = None
+_job_pool_lock = threading.Lock()
+_requests_in_flight = 0
+# Notified when the last running request finishes
+_requests_idle = threading.Condition()
+
+
+@bp.before_app_request
+def _request_started():
+    global _requests_in_flight
+    with _requests_idle:
+        _requests_in_flight += 1
+    g.in_flight = True
+
+
+@bp.teardown_app_request
+def _request_finished(exc):
+    global _requests_in_flight
+    if g.pop('in_flight', False):
+        with _requests_idle:
+            _requests_in_flight -= 1
+            if not _requests_in_flight:
+                _requests_idle.notify_all()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when someone cancelled it."""
+
+
+def job_handler(kind):
+    """Register handler(job, params) as the code that runs jobs of this kind.
+
+    The handler gets a JobContext and the params dict given to submit_job,
+    and returns the job's result (a file name in JOB_FILES_DIR or a summary).
+    """
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+def get_job_pool():
+    global _job_pool
+    if _job_pool is None:
+        with _job_pool_lock:
+            if _job_pool is None:
+                _job_pool = ThreadPoolExecutor(
+                    max_workers=current_app.config['JOB_WORKERS'],
+                    thread_name_prefix='job'
+                )
+    return _job_pool
+
+
+class JobContext:
+    """What a running job handler uses to report progress."""
+
+    def __init__(self, job_id, done=0):
+        self.id = job_id
+        # Progress saved by an earlier, interrupted run
+        self.resume_from = done
+
+    def progress(self, done, total=None, session=None):
+        """Record progress, and stop the job if it was cancelled.
+
+        With session, the update is part of that session's transaction (so
+        it commits together with the work it describes); otherwise it is
+        written straight away.
+        """
+        jobs = Job.__table__
+        with db.engine.connect() as conn:
+            cancelled = conn.scalar(db.select(jobs.c.cancel_requested).where(jobs.c.id == self.id))
+        if cancelled:
+            raise JobCancelled()
+        values = {'done': done}
+        if total is not None:
+            values['total'] = total
+        update = jobs.update().where(jobs.c.id == self.id).values(**values)
+        if session is not None:
+            session.execute(update)
+        else:
+            with db.engine.begin() as conn:
+                conn.execute(update)
+
+    def path(self, filename):
+        """Full path of a file in JOB_FILES_DIR."""
+        return os.path.join(current_app.config['JOB_FILES_DIR'], filename)
+
+    def background(self, rows):
+        """Pass rows through, pausing every JOB_YIELD_EVERY rows while
+        requests are being served (up to JOB_YIELD_MS per pause)."""
+        max_wait = current_app.config['JOB_YIELD_MS'] / 1000
+        for count, row in enumerate(rows, start=1):
+            yield row
+            if max_wait and count % JOB_YIELD_EVERY == 0 and _requests_in_flight:
+                # Blocked on the condition the thread doesn't ask for the GIL,
+                # which sleeping in a loop would
+                with _requests_idle:
+                    _requests_idle.wait_for(lambda: not _requests_in_flight, timeout=max_wait)
+
+
+def submit_job(kind, params=None, user_id=None):
+    """Queue a job and return its id."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    jobs = Job.__table__
+    with db.engine.begin() as conn:
+        job_id = conn.execute(jobs.insert().values(
+            kind=kind, params=json.dumps(params or {}), status='queued', done=0,
+            cancel_requested=False, created_by=user_id, created_at=datetime.utcnow()
+        )).inserted_primary_key[0]
+    get_job_pool().submit(run_job, current_app._get_current_object(), job_id)
+    return job_id
+
+
+def cancel_job(job_id):
+    """Cancel a queued job at once, or ask a running one to stop.
+
+    Returns False if the job had already finished.
+    """
+    jobs = Job.__table__
+    with db.engine.begin() as conn:
+        cancelled = conn.execute(
+            jobs.update()
+                .where(jobs.c.id == job_id, jobs.c.status == 'queued')
+                .values(status='cancelled', finished_at=datetime.utcnow())
+        ).rowcount
+        if not cancelled:
+            cancelled = conn.execute(
+                jobs.update()
+                    .where(jobs.c.id == job_id, jobs.c.status == 'running')
+                    .values(cancel_requested=True)
+            ).rowcount
+    return bool(cancelled)
+
+
+def _finish_job(job_id, status, result=None, error=None):
+    jobs = Job.__table__
+    with db.engine.begin() as conn:
+        conn.execute(jobs.update().where(jobs.c.id == job_id).values(
+            status=status, result=result, error=error, finished_at=datetime.utcnow()))
+
+
+def run_job(app, job_id):
+    """Run one job on a pool thread (does nothing if it is no longer queued)."""
+    with app.app_context():
+        jobs = Job.__table__
+        with db.engine.begin() as conn:
+            # Claim the job; only one worker (or process) can win this
+            claimed = conn.execute(
+                jobs.update()
+                    .where(jobs.c.id == job_id, jobs.c.status == 'queued')
+                    .values(status='running', started_at=datetime.utcnow())
+            ).rowcount
+            if not claimed:
+                return
+            kind, params, done = conn.execute(
+                db.select(jobs.c.kind, jobs.c.params, jobs.c.done).where(jobs.c.id == job_id)
+            ).one()
+
+        try:
+            result = JOB_HANDLERS[kind](JobContext(job_id, done), json.loads(params))
+        except JobCancelled:
+            db.session.rollback()
+            _finish_job(job_id, 'cancelled')
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception("Job %s (%s) failed", job_id, kind)
+            _finish_job(job_id, 'failed', error=str(e))
+        else:
+            _finish_job(job_id, 'done', result=result)
+
+
+def requeue_interrupted_jobs():
+    """Queue again the jobs a stopped process left running.
+
+    Only safe while no other process is running jobs: call it once at
+    startup, before the workers start.
+    """
+    jobs = Job.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(jobs.update().where(jobs.c.status == 'running').values(status='queued')).rowcount
+
+
+def start_queued_jobs():
+    """Start all queued jobs on this process's pool. Any number of worker
+    processes may do this at the same time; each job is claimed by one."""
+    jobs = Job.__table__
+    with db.engine.connect() as conn:
+        queued = conn.scalars(db.select(jobs.c.id).where(jobs.c.status == 'queued').order_by(jobs.c.id)).all()
+    app = current_app._get_current_object()
+    for job_id in queued:
+        get_job_pool().submit(run_job, app, job_id)
+    return len(queued)
+
+
+def start_job_workers():
+    """Queue again the jobs a stopped process left running, and start all
+    queued jobs. Call once at startup, after init_db(), in a single process."""
+    requeue_interrupted_jobs()
+    return start_queued_jobs()
+
+
+@job_handler('export_hours')
+def export_hours_job(job, params):
+    """Write the payroll export for params (the export filters) to a CSV file."""
+    use_read_snapshot()
+    total = count_export_rows(params)
+    job.progress(0, total)
+
+    def counted(rows):
+        batch_size = current_app.config['EXPORT_BATCH_SIZE']
+        for count, row in enumerate(rows, start=1):
+            yield row
+            if count % batch_size == 0:
+                job.progress(count)
+
+    os.makedirs(current_app.config['JOB_FILES_DIR'], exist_ok=True)
+    filename = f"export-{job.id}.csv"
+    # Written under a temporary name, so a half-written file is never served
+    partial = job.path(filename + '.part')
+    try:
+        with open(partial, 'w', encoding='utf-8', newline='') as f:
+            # Small fetches: each one holds the GIL for less time
+            rows = job.background(counted(iter_export_rows(params, batch_size=500)))
+            for chunk in iter_export_csv(rows):
+                f.write(chunk)
+        os.replace(partial, job.path(filename))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    job.progress(total)
+    return filename
+
+
+@job_handler('import_hours')
+def import_hours_job(job, params):
+    """Import an uploaded file saved in JOB_FILES_DIR (see manager_import_hours).
+
+    The rows read so far are saved with every batch, so a restarted job
+    carries on after the last committed batch instead of importing it twice.
+    """
+    path = job.path(params['file'])
+    with open(path, 'rb') as f:
+        lines = sum(1 for _ in f)
+    job.progress(job.resume_from, lines - 1 if params.get('format') != 'jsonl' else lines)
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = read_jsonl_rows(f) if params.get('format') == 'jsonl' else read_csv_rows(f)
+        result = import_time_logs(
+            job.background(rows), skip=job.resume_from,
+            checkpoint=lambda rows_read: job.progress(rows_read, session=db.session)
+        )
+    os.remove(path)
+    summary = f"{result['accepted']} imported, {result['rejected']} rejected"
+    if result['errors']:
+        summary += ": " + "; ".join(result['errors'])
+    return summary
+
+
+@job_handler('rebuild_aggregates')
+def rebuild_aggregates_job(job, params):
+    """Recompute the approved-hour counters and the rollups from TimeLog."""
+    job.progress(0, 2)
+    reconcile_totals()
+    job.progress(1)
+    rebuild_rollups()
+    job.progress(2)
+    return "Counters and rollups rebuilt"
 
-@app.before_request
-def setup():
-    global app_initialized
-    if not app_initialized:
-        db.create_all()
-        create_admin()
-        app_initialized = True
 
 # ------------------------------------------------------------------------
 # Routes
 # ------------------------------------------------------------------------
 
-@app.route('/')
+@bp.route('/')
 def home():
     """Public homepage: info, login, signup links."""
     return render_template('home.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login route (both admin and employee)."""
     if request.method == 'POST':
@@ -147,21 +2536,29 @@ def login():
         password = request.form['password']
 
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
+        # Give the database connection back before the slow hash check, so
+        # logins waiting for the hashing pool don't hold pool connections
+        db.session.close()
+        if user and verify_password(user.password, password):
+            # Upgrade hashes made with an older cost setting while we have the password
+            if needs_rehash(user.password):
+                user.password = hash_password(password)
+                db.session.add(user)
+                db.session.commit()
             session['user_id'] = user.id
             session['role'] = user.role
             flash("Logged in successfully!", "success")
             # Redirect based on role
             if user.role == 'admin':
-                return redirect(url_for('manager_dashboard'))
+                return redirect(url_for('main.manager_dashboard'))
             else:
-                return redirect(url_for('employee_dashboard'))
+                return redirect(url_for('main.employee_dashboard'))
         else:
             flash("Invalid credentials.", "danger")
     return render_template('login.html')
 
 
-@app.route('/signup', methods=['GET', 'POST'])
+@bp.route('/signup', methods=['GET', 'POST'])
 def signup():
     """Signup for new employees. (Admin can also create employees in manager area.)"""
     if request.method == 'POST':
@@ -172,67 +2569,89 @@ def signup():
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             flash("Username already exists. Choose another!", "danger")
-            return redirect(url_for('signup'))
+            return redirect(url_for('main.signup'))
 
-        # If it doesn't exist, proceed to create
-        hashed = generate_password_hash(password, method='pbkdf2:sha256')
+        # If it doesn't exist, proceed to create (without holding a
+        # database connection while the password is hashed)
+        db.session.close()
+        hashed = hash_password(password)
         new_user = User(username=username, password=hashed, role='employee')
         db.session.add(new_user)
         db.session.commit()
         flash("Your account has been created. Please log in.", "success")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('signup.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Simple logout route."""
     session.clear()
     flash("You have been logged out.", "info")
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
 # -----------------------
 # EMPLOYEE AREA
 # -----------------------
-@app.route('/employee/dashboard')
+@bp.route('/employee/dashboard')
 @login_required
+@query_budget(5)
 def employee_dashboard():
     # If user is admin, redirect to manager
     if session.get('role') == 'admin':
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
     
     user_id = session['user_id']
-    user = User.query.get(user_id)
-    logs = TimeLog.query.filter_by(user_id=user_id).order_by(TimeLog.log_date.desc()).all()
-
-    # Calculate approved hours per project
-    project_hours = {}
-    total_approved_hours = 0
-    for log in logs:
-        if log.approved:
-            project = log.project
-            if project not in project_hours:
-                project_hours[project] = 0
-            project_hours[project] += log.hours
-            total_approved_hours += log.hours
+    # The template lists the user's projects and each log's project
+    user = User.query.options(db.selectinload(User.projects)).get(user_id)
+    per_page = current_app.config['LOGS_PER_PAGE']
+    logs = TimeLog.query.options(db.joinedload(TimeLog.project))
+
+    # Approved history and pending logs are paged independently
+    approved_logs, approved_next = keyset_page(
+        logs.filter_by(user_id=user_id, approved=True),
+        parse_cursor(request.args.get('after')),
+        per_page
+    )
+    pending_logs, pending_next = keyset_page(
+        logs.filter_by(user_id=user_id, approved=False),
+        parse_cursor(request.args.get('pending_after')),
+        per_page
+    )
+
+    # Approved hours per project, from the user's monthly rollups (these
+    # also cover the archived logs)
+    sums = db.select(HoursRollup.project_id, db.func.sum(HoursRollup.hours).label('hours'))\
+        .where(HoursRollup.user_id == user_id, HoursRollup.period == 'month')\
+        .group_by(HoursRollup.project_id)\
+        .subquery()
+    project_hours = db.session.query(Project, sums.c.hours)\
+        .join(sums, sums.c.project_id == Project.id)\
+        .order_by(Project.id)\
+        .all()
+    # Lifetime total is kept up to date by adjust_approved_hours()
+    total_approved_hours = user.hours_worked or 0.0
 
     return render_template(
         'employee_dashboard.html',
         user=user,
-        logs=logs,
+        approved_logs=approved_logs,
+        approved_next=approved_next,
+        pending_logs=pending_logs,
+        pending_next=pending_next,
         project_hours=project_hours,
         total_approved_hours=total_approved_hours
     )
 
 
-@app.route('/employee/log-hours', methods=['POST'])
+@bp.route('/employee/log-hours', methods=['POST'])
 @login_required
 def employee_log_hours():
     """Process a new time log from an employee."""
     if session.get('role') == 'admin':
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
     
     user_id = session['user_id']
     hours = request.form.get('hours', 0)
@@ -251,7 +2670,21 @@ def employee_log_hours():
         log_date = date.today()
 
     # Convert hours to float
-    hours_val = float(hours) if hours else 0.0
+    try:
+        hours_val = float(hours) if hours else 0.0
+    except ValueError:
+        hours_val = math.nan
+    if not math.isfinite(hours_val):
+        flash("Hours must be a number.", "danger")
+        return redirect(url_for('main.employee_dashboard'))
+
+    if current_app.config['GROUP_COMMIT']:
+        get_group_commit_writer().insert({
+            'user_id': user_id, 'project_id': project_id, 'log_date': log_date,
+            'hours': hours_val, 'approved': False,
+        })
+        flash("Hours logged successfully.", "success")
+        return redirect(url_for('main.employee_dashboard'))
 
     # Create the new TimeLog with both user_id and project_id
     new_log = TimeLog(
@@ -265,32 +2698,33 @@ def employee_log_hours():
     db.session.commit()
 
     flash("Hours logged successfully.", "success")
-    return redirect(url_for('employee_dashboard'))
+    return redirect(url_for('main.employee_dashboard'))
 
 #allow emplyees to delete their own logs only for unapproved logs
 
-@app.route('/employee/delete-log/<int:log_id>', methods=['POST'])
+@bp.route('/employee/delete-log/<int:log_id>', methods=['POST'])
 @login_required
 def employee_delete_log(log_id):
     """Delete a time log entry."""
     log = TimeLog.query.get_or_404(log_id)
     if log.user_id != session['user_id']:
         flash("You can only delete your own logs.", "danger")
-        return redirect(url_for('employee_dashboard'))
+        return redirect(url_for('main.employee_dashboard'))
     if log.approved:
         flash("You cannot delete approved logs.", "danger")
-        return redirect(url_for('employee_dashboard'))
-    db.session.delete(log)
+        return redirect(url_for('main.employee_dashboard'))
+    delete_time_log(log)
     db.session.commit()
     flash("Log deleted.", "success")
-    return redirect(url_for('employee_dashboard'))
+    return redirect(url_for('main.employee_dashboard'))
 
-@app.route('/employee/edit-profile', methods=['GET', 'POST'])
+@bp.route('/employee/edit-profile', methods=['GET', 'POST'])
 @login_required
+@query_budget(1)
 def employee_edit_profile():
     """Allows employee to update personal info (phone, address, etc.)."""
     if session.get('role') == 'admin':
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
 
     user = User.query.get(session['user_id'])
     if request.method == 'POST':
@@ -304,7 +2738,7 @@ def employee_edit_profile():
             user.birthdate = date(y, m, d)
         db.session.commit()
         flash("Profile updated!", "success")
-        return redirect(url_for('employee_dashboard'))
+        return redirect(url_for('main.employee_dashboard'))
 
     return render_template('employee_edit_profile.html', user=user)
 
@@ -312,40 +2746,75 @@ def employee_edit_profile():
 # -----------------------
 # MANAGER AREA
 # -----------------------
-@app.route('/manager/dashboard')
+@bp.route('/manager/dashboard')
 @admin_required
+@query_budget(1)
+@cached_page
 def manager_dashboard():
-    projects = Project.query.all()
-    employees = User.query.filter(User.role != 'admin').all()
+    """
+    The dashboard page itself only holds the forms; the employee, project
+    and pending-hours tables are fragments the browser loads separately
+    (see static/js/dashboard.js), a page at a time, each one cached on its
+    own. Nothing on this page grows with the number of employees or projects.
+    """
+    return render_template('manager_dashboard.html', pending_after=request.args.get('after'))
 
-    project_summaries = []
-    for p in projects:
-        approved_hours = db.session.query(db.func.sum(TimeLog.hours))\
-            .filter(TimeLog.project_id == p.id, TimeLog.approved == True)\
-            .scalar() or 0.0
-        project_summaries.append((p, approved_hours))
 
-    employee_summaries = []
-    for emp in employees:
-        approved_hours = db.session.query(db.func.sum(TimeLog.hours))\
-            .filter(TimeLog.user_id == emp.id, TimeLog.approved == True)\
-            .scalar() or 0.0
-        employee_summaries.append((emp, approved_hours))
+@bp.route('/manager/dashboard/employees')
+@admin_required
+@query_budget(3)
+@cached_page(flashes=False)
+def manager_dashboard_employees():
+    """One page of the employee table (?after=<last id>)."""
+    employees, next_after = id_page(
+        User.query.options(db.selectinload(User.projects)).filter(User.role != 'admin'),
+        User, request.args.get('after'), current_app.config['DASHBOARD_PAGE_SIZE']
+    )
+    return render_template('fragments/manager_employees.html',
+                           employees=employees, next_after=next_after)
 
-    # NEW: get pending logs
-    pending_logs = TimeLog.query.filter_by(approved=False).all()
 
-    return render_template(
-        'manager_dashboard.html',
-        projects=projects,
-        employees=employees,
-        project_summaries=project_summaries,
-        employee_summaries=employee_summaries,
-        pending_logs=pending_logs
+@bp.route('/manager/dashboard/projects')
+@admin_required
+@query_budget(2)
+@cached_page(flashes=False)
+def manager_dashboard_projects():
+    """One page of the project table (?after=<last id>)."""
+    projects, next_after = id_page(Project.query, Project, request.args.get('after'),
+                                   current_app.config['DASHBOARD_PAGE_SIZE'])
+    return render_template('fragments/manager_projects.html',
+                           projects=projects, next_after=next_after)
+
+
+@bp.route('/manager/dashboard/pending')
+@admin_required
+@query_budget(2)
+@cached_page(flashes=False)
+def manager_dashboard_pending():
+    """One page of hours waiting for approval, oldest first (?after=<cursor>)."""
+    pending_logs, pending_next = keyset_page(
+        TimeLog.query.options(db.joinedload(TimeLog.user), db.joinedload(TimeLog.project))\
+            .filter_by(approved=False),
+        parse_cursor(request.args.get('after')),
+        current_app.config['LOGS_PER_PAGE'],
+        descending=False
     )
+    return render_template('fragments/manager_pending.html',
+                           pending_logs=pending_logs, pending_next=pending_next)
+
+
+@bp.route('/manager/dashboard/project-options')
+@admin_required
+@query_budget(2)
+@cached_page(flashes=False)
+def manager_dashboard_project_options():
+    """<option>s for every project, fetched once by the dashboard and
+    copied into each project <select> on it."""
+    projects = db.session.execute(db.select(Project.id, Project.name).order_by(Project.name)).all()
+    return render_template('fragments/project_options.html', projects=projects)
 
 
-@app.route('/manager/add-employee', methods=['GET','POST'])
+@bp.route('/manager/add-employee', methods=['GET','POST'])
 @admin_required
 def manager_add_employee():
     """Allows manager to create a new employee account quickly."""
@@ -358,69 +2827,69 @@ def manager_add_employee():
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             flash("Username already exists. Choose another!", "danger")
-            return redirect(url_for('manager_add_employee'))
+            return redirect(url_for('main.manager_add_employee'))
         
         # If it doesn't exist, proceed to create
-        hashed = generate_password_hash(password, method='pbkdf2:sha256')
+        hashed = hash_password(password)
         new_user = User(username=username, password=hashed, role=role)
         db.session.add(new_user)
         db.session.commit()
         flash("Employee created!", "success")
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
     
     return render_template('manager_add_employee.html')
 
 
 
-@app.route('/manager/edit-employee/<int:user_id>', methods=['GET','POST'])
+@bp.route('/manager/edit-employee/<int:user_id>', methods=['GET','POST'])
 @admin_required
+@query_budget(3)
 def manager_edit_employee(user_id):
     """Manager can edit an existing employee."""
-    emp = User.query.get_or_404(user_id)
+    emp = User.query.options(db.selectinload(User.projects)).get_or_404(user_id)
     projects = Project.query.all()
 
     if request.method == 'POST':
         emp.username = request.form['username']
         new_password = request.form['password']
         if new_password.strip():
-            emp.password = generate_password_hash(new_password, method='pbkdf2:sha256')
+            emp.password = hash_password(new_password)
         emp.role = request.form.get('role', 'employee')
 
-        # You could also let the manager assign multiple projects.
-        # For a single project, you might do something different, but with many-to-many,
-        # you'd typically have a multi-select or checkboxes.
-        # Below is just a single project dropdown example:
-        project_id = request.form.get('project_id')
-        if project_id:
-            # Clear existing
-            emp.projects = []
-            # Assign new one
-            project = Project.query.get(project_id)
-            if project:
-                emp.projects.append(project)
+        # The form always sends the marker, and project_ids (a multi-select)
+        # only when something is selected
+        if request.form.get('assign_projects'):
+            project_ids = [int(pid) for pid in request.form.getlist('project_ids')]
+            assign_projects([emp.id], project_ids)
 
         db.session.commit()
         flash("Employee updated!", "success")
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
 
     return render_template('manager_edit_employee.html', emp=emp, projects=projects)
 
 
-@app.route('/manager/delete-employee/<int:user_id>', methods=['POST'])
+@bp.route('/manager/delete-employee/<int:user_id>', methods=['POST'])
 @admin_required
 def manager_delete_employee(user_id):
     if session['user_id'] == user_id:
         flash("You cannot delete your own admin account.", "danger")
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
     
-    emp = User.query.get_or_404(user_id)
-    db.session.delete(emp)
+    User.query.get_or_404(user_id)
+    try:
+        delete_employee(user_id, request.form.get('logs', 'archive'),
+                        request.form.get('reassign_to', type=int))
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "danger")
+        return redirect(url_for('main.manager_dashboard'))
     db.session.commit()
     flash("Employee deleted.", "success")
-    return redirect(url_for('manager_dashboard'))
+    return redirect(url_for('main.manager_dashboard'))
 
 
-@app.route('/manager/add-project', methods=['GET', 'POST'])
+@bp.route('/manager/add-project', methods=['GET', 'POST'])
 @admin_required
 def manager_add_project():
     if request.method == 'POST':
@@ -430,12 +2899,13 @@ def manager_add_project():
         db.session.add(new_project)
         db.session.commit()
         flash("Project created!", "success")
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
     return render_template('manager_add_project.html')
 
 
-@app.route('/manager/edit-project/<int:project_id>', methods=['GET','POST'])
+@bp.route('/manager/edit-project/<int:project_id>', methods=['GET','POST'])
 @admin_required
+@query_budget(1)
 def manager_edit_project(project_id):
     proj = Project.query.get_or_404(project_id)
     if request.method == 'POST':
@@ -443,22 +2913,28 @@ def manager_edit_project(project_id):
         proj.description = request.form['description']
         db.session.commit()
         flash("Project updated!", "success")
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
     return render_template('manager_edit_project.html', proj=proj)
 
 
-@app.route('/manager/delete-project/<int:project_id>', methods=['POST'])
+@bp.route('/manager/delete-project/<int:project_id>', methods=['POST'])
 @admin_required
 def manager_delete_project(project_id):
-    proj = Project.query.get_or_404(project_id)
-    db.session.delete(proj)
+    Project.query.get_or_404(project_id)
+    try:
+        delete_project(project_id, request.form.get('logs', 'archive'),
+                       request.form.get('reassign_to', type=int))
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "danger")
+        return redirect(url_for('main.manager_dashboard'))
     db.session.commit()
     flash("Project deleted!", "success")
-    return redirect(url_for('manager_dashboard'))
+    return redirect(url_for('main.manager_dashboard'))
 
 
 # Example of a route to assign multiple projects (optional)
-@app.route('/manager/assign-projects/<int:user_id>', methods=['POST'])
+@bp.route('/manager/assign-projects/<int:user_id>', methods=['POST'])
 @admin_required
 def manager_assign_projects(user_id):
     """
@@ -472,45 +2948,197 @@ def manager_assign_projects(user_id):
     selected_ids = request.form.getlist('project_ids')  # e.g. ['1', '3', '5']
     project_ids = [int(pid) for pid in selected_ids]
 
-    # Clear the existing assignments
-    emp.projects = []
+    # Replace the current assignments; only the rows that change are written
+    assign_projects([emp.id], project_ids)
+    db.session.commit()
+    flash("Projects assigned!", "success")
+    return redirect(url_for('main.manager_dashboard'))
 
-    # Add each project
-    for pid in project_ids:
-        project = Project.query.get(pid)
-        if project:
-            emp.projects.append(project)
+@bp.route('/manager/assign-projects', methods=['POST'])
+@admin_required
+def manager_assign_projects_bulk():
+    """
+    Assign projects to many employees in one request (and one transaction).
+    Accepts form fields or a JSON body with:
+      user_ids (list), project_ids (list), mode ('set', 'add' or 'remove', default 'add')
+    and returns the number of assignments added and removed.
+    """
+    wants_json = request.is_json
+    if wants_json:
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get('user_ids') or []
+        project_ids = data.get('project_ids') or []
+    else:
+        data = request.form
+        user_ids = data.getlist('user_ids')
+        project_ids = data.getlist('project_ids')
+
+    try:
+        user_ids = [int(i) for i in user_ids]
+        project_ids = [int(i) for i in project_ids]
+        mode = data.get('mode') or 'add'
+        if mode not in ASSIGN_MODES:
+            raise ValueError(mode)
+    except (TypeError, ValueError):
+        error = "Invalid selection."
+    else:
+        error = None if user_ids else "Select some employees."
+
+    if error:
+        if wants_json:
+            return jsonify(error=error), 400
+        flash(error, "danger")
+        return redirect(url_for('main.manager_dashboard'))
 
+    added, removed = assign_projects(user_ids, project_ids, mode)
     db.session.commit()
-    flash("Projects assigned!", "success")
-    return redirect(url_for('manager_dashboard'))
 
+    if wants_json:
+        return jsonify(added=added, removed=removed)
+    flash(f"Project assignments updated ({added} added, {removed} removed).", "success")
+    return redirect(url_for('main.manager_dashboard'))
+
+
+@bp.route('/manager/approve-hours/<int:hour_id>', methods=['POST'])
 @admin_required
-@app.route('/manager/approve-hours/<int:hour_id>', methods=['POST'])
 def manger_approve_hours(hour_id):
     """Approve hours for a specific TimeLog entry."""
     log = TimeLog.query.get_or_404(hour_id)
-    log.approved = True
+    if not log.approved:
+        log.approved = True
+        adjust_approved_hours(log.user_id, log.project_id, log.hours or 0.0, log.log_date)
     db.session.commit()
     flash("Hours approved!", "success")
-    return redirect(url_for('manager_dashboard'))
+    return redirect(url_for('main.manager_dashboard'))
+
+
+@bp.route('/manager/approve-hours', methods=['POST'])
+@admin_required
+def manager_approve_hours_bulk():
+    """
+    Approve many pending TimeLog entries at once.
+    Accepts form fields or a JSON body with any of:
+      log_ids (list), project_id, user_id, date_from, date_to ("YYYY-MM-DD")
+    and returns the number of approved entries.
+    """
+    wants_json = request.is_json
+    if wants_json:
+        data = request.get_json(silent=True) or {}
+    else:
+        data = request.form
+
+    try:
+        if wants_json:
+            log_ids = data.get('log_ids') or []
+        else:
+            log_ids = data.getlist('log_ids')
+        conditions = time_log_filters(data)
+        if log_ids:
+            conditions.append(TimeLog.id.in_([int(i) for i in log_ids]))
+    except (TypeError, ValueError):
+        error = "Invalid selection."
+    else:
+        # Never approve the whole queue by accident
+        error = None if conditions else "Select some entries or a filter to approve."
+
+    if error:
+        if wants_json:
+            return jsonify(error=error), 400
+        flash(error, "danger")
+        return redirect(url_for('main.manager_dashboard'))
+
+    approved = approve_time_logs(conditions)
+    db.session.commit()
+
+    if wants_json:
+        return jsonify(approved=approved)
+    flash(f"{approved} entries approved!", "success")
+    return redirect(url_for('main.manager_dashboard'))
+
+
+@bp.route('/manager/reports')
+@admin_required
+@query_budget(3)
+@snapshot_reads
+def manager_reports():
+    """Approved hours per day / week / month, grouped by employee and/or project."""
+    period = request.args.get('period', 'week')
+    group_by = request.args.get('group_by', 'project')
+    if period not in ROLLUP_PERIODS:
+        period = 'week'
+    if group_by not in ('total', 'user', 'project', 'user_project'):
+        group_by = 'project'
+
+    try:
+        date_from = request.args.get('date_from')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = request.args.get('date_to')
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+        user_id = int(request.args['user_id']) if request.args.get('user_id') else None
+        project_id = int(request.args['project_id']) if request.args.get('project_id') else None
+    except ValueError:
+        flash("Invalid report filter.", "danger")
+        return redirect(url_for('main.manager_reports'))
+
+    rows = rollup_report(period, group_by, date_from, date_to, user_id, project_id)
+    return render_template(
+        'manager_reports.html',
+        rows=rows,
+        period=period,
+        group_by=group_by,
+        total_hours=sum(row[3] for row in rows)
+    )
+
+
+@bp.route('/manager/export-hours')
+@admin_required
+@snapshot_reads
+def manager_export_hours():
+    """
+    Download approved hours as CSV for payroll.
+    Optional query parameters: date_from, date_to, project_id, user_id.
+    """
+    try:
+        time_log_filters(request.args)
+    except ValueError:
+        flash("Invalid export filter.", "danger")
+        return redirect(url_for('main.manager_dashboard'))
+
+    filename = "hours_{}_{}.csv".format(
+        request.args.get('date_from') or 'start',
+        request.args.get('date_to') or date.today().isoformat()
+    )
+    return Response(
+        stream_with_context(iter_export_csv(iter_export_rows(request.args))),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 
 # manager add hours new route
-@app.route('/manager/add-hour', methods=['GET', 'POST'])
+@bp.route('/manager/add-hour', methods=['GET', 'POST'])
 @admin_required
+@query_budget(2)
 def manager_add_hour():
     employees = User.query.filter(User.role != 'admin').all()
     projects = Project.query.all()
 
     if request.method == 'POST':
-        user_id = request.form['user_id']
-        project_id = request.form['project_id']
-        log_date_str = request.form['date']
-        hours = request.form['hours']
-
-        # Convert the string (e.g. "2025-01-14") into a date object
-        log_date_obj = datetime.strptime(log_date_str, '%Y-%m-%d').date()
+        try:
+            user_id = int(request.form['user_id'])
+            project_id = int(request.form['project_id'])
+            # Convert the string (e.g. "2025-01-14") into a date object
+            log_date_obj = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+        except ValueError:
+            flash("Choose an employee, a project and a date.", "danger")
+            return redirect(url_for('main.manager_add_hour'))
+        try:
+            hours = float(request.form['hours'])
+        except ValueError:
+            hours = math.nan
+        if not math.isfinite(hours):
+            flash("Hours must be a number.", "danger")
+            return redirect(url_for('main.manager_add_hour'))
 
         time_log = TimeLog(
             user_id=user_id,
@@ -520,22 +3148,434 @@ def manager_add_hour():
             approved=True
         )
         db.session.add(time_log)
+        # Hours added by a manager are approved straight away
+        adjust_approved_hours(user_id, project_id, hours, log_date_obj)
         db.session.commit()
         flash("Hours added!", "success")
-        return redirect(url_for('manager_dashboard'))
+        return redirect(url_for('main.manager_dashboard'))
 
     return render_template('manager_add_hour.html', employees=employees, projects=projects)
 
 
-@app.route('/manager/delete-hour/<int:hour_id>', methods=['POST'])
+@bp.route('/manager/import-hours', methods=['GET', 'POST'])
+@admin_required
+def manager_import_hours():
+    """Upload a CSV or JSON-lines file of time logs (see import_time_logs)."""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Choose a file to import.", "danger")
+            return redirect(url_for('main.manager_import_hours'))
+
+        is_jsonl = upload.filename.lower().endswith(('.jsonl', '.json', '.ndjson'))
+        if request.form.get('background'):
+            # Keep the file and let a background job import it
+            os.makedirs(current_app.config['JOB_FILES_DIR'], exist_ok=True)
+            filename = f"import-{uuid.uuid4().hex}.{'jsonl' if is_jsonl else 'csv'}"
+            upload.save(os.path.join(current_app.config['JOB_FILES_DIR'], filename))
+            job_id = submit_job('import_hours', {'file': filename, 'format': 'jsonl' if is_jsonl else 'csv'},
+                                user_id=session['user_id'])
+            flash(f"Import started as job {job_id}.", "success")
+            return redirect(url_for('main.manager_jobs'))
+
+        # Read the upload as text, line by line, without loading it whole
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        if is_jsonl:
+            rows = read_jsonl_rows(stream)
+        else:
+            rows = read_csv_rows(stream)
+        result = import_time_logs(rows)
+
+        flash(f"Imported {result['accepted']} entries, rejected {result['rejected']}.",
+              "success" if not result['rejected'] else "warning")
+        for error in result['errors']:
+            flash(error, "warning")
+        return redirect(url_for('main.manager_dashboard'))
+
+    return render_template('manager_import_hours.html')
+
+
+# Jobs that can be started from a form or JSON request, and the fields
+# each one takes from it
+JOB_FORM_FIELDS = {
+    'export_hours': ('date_from', 'date_to', 'project_id', 'user_id'),
+    'rebuild_aggregates': (),
+}
+
+
+@bp.route('/manager/jobs', methods=['GET', 'POST'])
+@admin_required
+@query_budget(1)
+def manager_jobs():
+    """
+    GET: the most recent background jobs.
+    POST: start a job; form fields or a JSON body with kind ('export_hours'
+    or 'rebuild_aggregates') and, for exports, the export filters.
+    Returns the new job's id (JSON) or redirects to the job list.
+    """
+    if request.method == 'POST':
+        wants_json = request.is_json
+        data = (request.get_json(silent=True) or {}) if wants_json else request.form
+        kind = data.get('kind')
+        try:
+            if kind not in JOB_FORM_FIELDS:
+                raise ValueError(f"Unknown job kind: {kind}")
+            params = {name: data[name] for name in JOB_FORM_FIELDS[kind] if data.get(name)}
+            # Reject bad filters now rather than in the job
+            time_log_filters(params)
+        except ValueError as e:
+            if wants_json:
+                return jsonify(error=str(e)), 400
+            flash(str(e), "danger")
+            return redirect(url_for('main.manager_jobs'))
+
+        job_id = submit_job(kind, params, user_id=session['user_id'])
+        if wants_json:
+            return jsonify(id=job_id), 202
+        flash(f"Job {job_id} started.", "success")
+        return redirect(url_for('main.manager_jobs'))
+
+    jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    active = any(job.status not in JOB_FINISHED for job in jobs)
+    return render_template('manager_jobs.html', jobs=jobs, active=active)
+
+
+@bp.route('/manager/jobs/<int:job_id>')
+@admin_required
+def manager_job_status(job_id):
+    """Poll a job: status, progress (0-1 when the total is known) and result."""
+    return jsonify(Job.query.get_or_404(job_id).to_dict())
+
+
+@bp.route('/manager/jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def manager_cancel_job(job_id):
+    Job.query.get_or_404(job_id)
+    cancelled = cancel_job(job_id)
+    if request.is_json:
+        return jsonify(cancelled=cancelled)
+    if cancelled:
+        flash(f"Job {job_id} is being cancelled.", "success")
+    else:
+        flash(f"Job {job_id} has already finished.", "warning")
+    return redirect(url_for('main.manager_jobs'))
+
+
+@bp.route('/manager/jobs/<int:job_id>/download')
+@admin_required
+def manager_job_download(job_id):
+    """Download the file a finished export job wrote."""
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'done' or job.kind != 'export_hours':
+        flash("That job has no file to download.", "danger")
+        return redirect(url_for('main.manager_jobs'))
+    return send_file(os.path.join(current_app.config['JOB_FILES_DIR'], job.result),
+                     mimetype='text/csv', as_attachment=True,
+                     download_name=f"hours_job_{job.id}.csv")
+
+
+@bp.route('/manager/delete-hour/<int:hour_id>', methods=['POST'])
 @admin_required
 def manager_delete_hour(hour_id):
     hour_log = TimeLog.query.get_or_404(hour_id)
-    db.session.delete(hour_log)
+    delete_time_log(hour_log)
     db.session.commit()
     flash("Hour entry deleted.", "success")
-    return redirect(url_for('manager_dashboard'))
+    return redirect(url_for('main.manager_dashboard'))
+
+
+# -----------------------
+# JSON API (read-only)
+# -----------------------
+# Columns each resource may return; ?fields=a,b picks some of them and only
+# those columns are read from the database. The password is never exposed.
+API_FIELDS = {
+    'employees': {
+        'id': User.id, 'username': User.username, 'role': User.role,
+        'first_name': User.first_name, 'last_name': User.last_name,
+        'phone': User.phone, 'address': User.address, 'birthdate': User.birthdate,
+        'hours_worked': User.hours_worked,
+    },
+    'projects': {
+        'id': Project.id, 'name': Project.name, 'description': Project.description,
+        'total_hours': Project.total_hours,
+    },
+    'time_logs': {
+        'id': TimeLog.id, 'user_id': TimeLog.user_id, 'project_id': TimeLog.project_id,
+        'log_date': TimeLog.log_date, 'hours': TimeLog.hours, 'approved': TimeLog.approved,
+    },
+}
+
+
+def api_admin_required(f):
+    """Like admin_required, but answers with a JSON error instead of a redirect."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('role') != 'admin':
+            return jsonify(error="Admin access required."), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_view(f):
+    """Turn a view returning a dict into a compact JSON response with an ETag.
+
+    The ETag is derived from the data version and the URL, so a client that
+    sends it back in If-None-Match gets a 304 before the view runs at all.
+    Errors raised as ValueError become a 400 response.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        version, changed_at = current_data_version()
+        etag = hashlib.sha1(f"{version}:{request.full_path}".encode()).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            try:
+                payload = f(*args, **kwargs)
+            except ValueError as e:
+                return jsonify(error=str(e)), 400
+            body = json.dumps(payload, separators=(',', ':'), default=api_json_default)
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        if changed_at:
+            response.last_modified = changed_at
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    return decorated_function
+
+
+def api_json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def api_columns(resource, key_fields):
+    """Return (output field names, columns to select) for ?fields=.
+
+    key_fields are always selected (they are needed for the next-page
+    cursor) but only returned if they were asked for.
+    """
+    available = API_FIELDS[resource]
+    requested = request.args.get('fields')
+    if requested:
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    else:
+        names = list(available)
+    selected = names + [name for name in key_fields if name not in names]
+    return names, [available[name].label(name) for name in selected]
+
+
+def api_limit():
+    limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def api_page(rows, names, limit, cursor_of):
+    """Build the response for one page of rows (fetched with limit + 1)."""
+    next_cursor = cursor_of(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    if request.args.get('format') == 'rows':
+        # Column names once, then plain arrays: much smaller for big pages
+        items = {'fields': names, 'rows': [[row._mapping[n] for n in names] for row in rows]}
+    else:
+        items = {'items': [{n: row._mapping[n] for n in names} for row in rows]}
+    items['next'] = next_cursor
+    return items
+
+
+def api_id_page(resource, model, query):
+    """One page of a resource ordered by id, cursor = last id (?after=)."""
+    names, columns = api_columns(resource, ['id'])
+    limit = api_limit()
+    query = query.with_only_columns(*columns).order_by(model.id).limit(limit + 1)
+    if request.args.get('after'):
+        query = query.where(model.id > int(request.args['after']))
+    rows = db.session.execute(query).all()
+    return api_page(rows, names, limit, lambda row: row.id)
+
+
+@bp.route('/api/employees')
+@api_admin_required
+@query_budget(2)
+@api_view
+def api_employees():
+    return api_id_page('employees', User, db.select(User).where(User.role != 'admin'))
+
+
+@bp.route('/api/projects')
+@api_admin_required
+@query_budget(2)
+@api_view
+def api_projects():
+    return api_id_page('projects', Project, db.select(Project))
+
+
+@bp.route('/api/time-logs')
+@api_admin_required
+@query_budget(2)
+@api_view
+def api_time_logs():
+    """
+    Time logs ordered by (log_date, id), paged with ?after=<cursor>.
+    Filters: user_id, project_id, date_from, date_to, approved (0/1).
+    """
+    names, columns = api_columns('time_logs', ['log_date', 'id'])
+    limit = api_limit()
+    conditions = time_log_filters(request.args)
+    if request.args.get('approved') in ('0', '1'):
+        conditions.append(TimeLog.approved == (request.args['approved'] == '1'))
+    query = db.select(*columns).where(*conditions)\
+        .order_by(TimeLog.log_date, TimeLog.id)\
+        .limit(limit + 1)
+    cursor = parse_cursor(request.args.get('after'))
+    if cursor:
+        query = query.where(db.tuple_(TimeLog.log_date, TimeLog.id) > db.tuple_(*cursor))
+    rows = db.session.execute(query).all()
+    return api_page(rows, names, limit,
+                    lambda row: f"{row.log_date.isoformat()}.{row.id}")
+
+
+@bp.route('/api/search')
+@api_admin_required
+@query_budget(3)
+@api_view
+def api_search():
+    """Typeahead search over employees and projects: ?q=<text>&limit=<n>."""
+    limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    return search(request.args.get('q', ''), limit)
+
+
+@bp.route('/api/summary')
+@api_admin_required
+@query_budget(4)
+# Before api_view, so that the ETag is that of the snapshot's data version
+@snapshot_reads
+@api_view
+def api_summary():
+    """Approved hours per project and employee (from the counters) and the pending count."""
+    projects = db.session.execute(db.select(Project.id, Project.name, Project.total_hours)).all()
+    employees = db.session.execute(
+        db.select(User.id, User.username, User.hours_worked).where(User.role != 'admin')
+    ).all()
+    pending = db.session.execute(
+        db.select(db.func.count(), db.func.coalesce(db.func.sum(TimeLog.hours), 0.0))
+            .where(TimeLog.approved == False)
+    ).one()
+    return {
+        'projects': [{'id': p.id, 'name': p.name, 'hours': p.total_hours or 0.0} for p in projects],
+        'employees': [{'id': e.id, 'username': e.username, 'hours': e.hours_worked or 0.0} for e in employees],
+        'pending': {'count': pending[0], 'hours': pending[1]},
+    }
+
+
+# ------------------------------------------------------------------------
+# Application factory. Settings come from Config, a config file and the
+# environment (see Config); the routes live on the `main` blueprint. The
+# module-level `app` below is the default application, used by `flask`,
+# `python app.py` and the scripts; serve.py runs one in several processes.
+# ------------------------------------------------------------------------
+def load_env_config(config):
+    """Override settings from environment variables of the same name,
+    converted to the type of the default value."""
+    for env_name, value in os.environ.items():
+        name = CONFIG_ENV_ALIASES.get(env_name, env_name)
+        if not name.isupper() or not hasattr(Config, name):
+            continue
+        default = getattr(Config, name)
+        if isinstance(default, bool):
+            value = value.lower() in ('1', 'true', 'yes', 'on')
+        elif isinstance(default, (int, float)):
+            value = type(default)(value)
+        config[name] = value
+
+
+def load_secret_key(instance_path):
+    """Return the key kept in instance/secret_key, creating it the first time."""
+    path = os.path.join(instance_path, 'secret_key')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, encoding='ascii') as f:
+            return f.read().strip()
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        key = secrets.token_hex(32)
+        f.write(key)
+    return key
+
+
+def create_app(config=None):
+    """Create and configure the application.
+
+    config: optional mapping of settings that override all the others.
+    """
+    app = Flask(__name__, instance_relative_config=True)
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    app.config.from_object(Config)
+    app.config.from_pyfile('config.py', silent=True)
+    if os.environ.get('APP_CONFIG_FILE'):
+        app.config.from_envvar('APP_CONFIG_FILE')
+    load_env_config(app.config)
+    if config:
+        app.config.update(config)
+
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = load_secret_key(app.instance_path)
+    if not app.config['JOB_FILES_DIR']:
+        app.config['JOB_FILES_DIR'] = os.path.join(app.instance_path, 'jobs')
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    in_memory = url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+    # An in-memory SQLite database is a single shared connection, not a pool
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config and not in_memory:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+            'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+            'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        }
+
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(app, engine)
+    app.extensions['page_cache'] = PageCache(app.config['PAGE_CACHE_MAX_ENTRIES'],
+                                             app.config['PAGE_CACHE_MAX_BYTES'])
+    if app.config['READ_SNAPSHOT']:
+        path = app.config['READ_SNAPSHOT_PATH'] or os.path.join(app.instance_path, 'read_snapshot.db')
+        app.extensions['read_snapshot'] = ReadSnapshot(app, path, app.config['READ_SNAPSHOT_MAX_AGE'])
+    app.extensions['assets'] = load_assets(app)
+    app.register_blueprint(bp)
+    return app
+
+
+def _reset_after_fork():
+    # The pools' and writer's threads stay behind in the parent; a forked
+    # worker makes its own
+    global _hash_pool, _hash_pool_lock, _job_pool, _job_pool_lock
+    global _group_commit_writer, _group_commit_lock
+    _hash_pool, _hash_pool_lock = None, threading.Lock()
+    _job_pool, _job_pool_lock = None, threading.Lock()
+    _group_commit_writer, _group_commit_lock = None, threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Not on Windows, which has no fork (only serve.py forks)
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+app = create_app()
 
 
 if __name__ == '__main__':
+    # Development server (one process, with the debugger); see serve.py
+    with app.app_context():
+        init_db()
+        # The reloader runs this file twice; only the serving process runs jobs
+        if is_running_from_reloader():
+            start_job_workers()
     app.run(debug=True)
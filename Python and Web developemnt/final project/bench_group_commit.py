@@ -0,0 +1,109 @@
+"""
+Benchmark: durable time log inserts per second, one commit per row vs
+group commit.
+
+Many threads insert time logs as fast as they can, the way concurrent
+employee_log_hours requests do, without the rest of the request around
+it (see `bench_routes.py --only employee_log_hours` for that):
+
+    per-row  every insert is its own ORM commit (GROUP_COMMIT off)
+    group    inserts go through GroupCommitWriter (GROUP_COMMIT on)
+
+Both modes commit with synchronous=FULL (--synchronous), so every
+confirmed row has been fsynced in both. Uses a throwaway database.
+
+Usage:
+    python bench_group_commit.py [--threads 1,16,64] [--seconds 5]
+    python bench_group_commit.py --window-ms 5 --max-batch 1000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+from app import app, db, User, Project, TimeLog, GroupCommitWriter, init_db
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def insert_per_row(row):
+    db.session.add(TimeLog(**row))
+    db.session.commit()
+
+
+def run(mode, threads, seconds, user_ids, project_id, writer):
+    samples = []
+    deadline = time.perf_counter() + seconds
+
+    def worker(user_id):
+        row = {'user_id': user_id, 'project_id': project_id, 'log_date': date.today(),
+               'hours': 8.0, 'approved': False}
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                if mode == 'group':
+                    writer.insert(row)
+                else:
+                    insert_per_row(row)
+                samples.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(user_ids[i % len(user_ids)],)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return len(samples) / elapsed, percentile(samples, 50) * 1000, percentile(samples, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable inserts per second, per-row vs group commit.")
+    parser.add_argument('--threads', default='1,16,64', help="comma-separated numbers of inserting threads")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--window-ms', type=float, default=app.config['GROUP_COMMIT_WINDOW_MS'])
+    parser.add_argument('--max-batch', type=int, default=app.config['GROUP_COMMIT_MAX_BATCH'])
+    parser.add_argument('--synchronous', default='FULL', help="PRAGMA synchronous of every commit")
+    args = parser.parse_args()
+
+    app.config['SQLITE_SYNCHRONOUS'] = args.synchronous
+    app.config['SLOW_QUERY_MS'] = float('inf')
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    with app.app_context():
+        init_db()
+        users = [User(username=f'employee{i}', password='-') for i in range(64)]
+        project = Project(name='benchmark')
+        db.session.add_all(users + [project])
+        db.session.commit()
+        user_ids = [u.id for u in users]
+        project_id = project.id
+        writer = GroupCommitWriter(app, args.window_ms, args.max_batch, args.synchronous)
+
+    print(f"synchronous={args.synchronous}, window {args.window_ms:g} ms, batches up to {args.max_batch}")
+    print(f"{'mode':<8} {'threads':>7} {'rows/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for threads in [int(n) for n in args.threads.split(',')]:
+        results = {}
+        for mode in ('per-row', 'group'):
+            results[mode] = run(mode, threads, args.seconds, user_ids, project_id, writer)
+            rate, p50, p99 = results[mode]
+            print(f"{mode:<8} {threads:7d} {rate:9.0f} {p50:8.2f} {p99:8.2f}", flush=True)
+        print(f"{'':<8} {'':>7} {results['group'][0] / results['per-row'][0]:8.1f}x")
+
+    with app.app_context():
+        total = db.session.scalar(db.select(db.func.count()).select_from(TimeLog))
+    print(f"{total} rows inserted")
+
+
+if __name__ == '__main__':
+    main()
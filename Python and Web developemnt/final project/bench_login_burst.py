@@ -0,0 +1,141 @@
+"""
+Benchmark: dashboard latency during a burst of logins.
+
+Starts the app on a local threaded server with a throwaway database and
+measures /manager/dashboard latency, first on its own and then while many
+clients log in at the same time. Compare runs with different pool sizes:
+
+    python bench_login_burst.py --hash-workers 1
+    python bench_login_burst.py --hash-workers 32   # about the same as hashing inline
+
+Usage:
+    python bench_login_burst.py [--hash-workers N] [--logins N] [--login-threads N]
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+tmp_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+
+from werkzeug.serving import make_server
+
+from app import app, db, User, init_db, hash_password, needs_rehash
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Stop at the login redirect instead of also loading the dashboard."""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def post_login(base_url, username, password):
+    opener = urllib.request.build_opener(NoRedirect)
+    data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    try:
+        opener.open(base_url + '/login', data=data).read()
+    except urllib.error.HTTPError as e:
+        # The 302 after a successful login ends up here
+        if e.code != 302:
+            raise
+
+
+def time_dashboard(opener, url, stop, samples):
+    """Load the dashboard in a loop until stop is set, recording latencies."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        opener.open(url).read()
+        samples.append(time.perf_counter() - started)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(name, samples):
+    print(f"{name:>14}: {len(samples):5d} requests  "
+          f"p50 {statistics.median(samples) * 1000:7.1f} ms  "
+          f"p99 {percentile(samples, 99) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard latency during a login burst.")
+    parser.add_argument('--hash-workers', type=int, default=app.config['PASSWORD_HASH_WORKERS'])
+    parser.add_argument('--logins', type=int, default=200, help="logins in the burst")
+    parser.add_argument('--login-threads', type=int, default=32, help="concurrent login clients")
+    parser.add_argument('--baseline-seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    app.config['PASSWORD_HASH_WORKERS'] = args.hash_workers
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    with app.app_context():
+        init_db()
+        password = hash_password('secret')
+        # Otherwise every login in the burst would hash twice
+        if needs_rehash(password):
+            raise SystemExit(f"A new hash needs rehashing: {password.split('$', 1)[0]}")
+        db.session.add_all(User(username=f'employee{i}', password=password) for i in range(50))
+        db.session.commit()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    # Admin session used to load the dashboard
+    dashboard = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    data = urllib.parse.urlencode({'username': 'admin', 'password': '1234'}).encode()
+    dashboard.open(base_url + '/login', data=data).read()
+    dashboard_url = base_url + '/manager/dashboard'
+
+    # 1. Dashboard on its own
+    idle, stop = [], threading.Event()
+    timer = threading.Thread(target=time_dashboard, args=(dashboard, dashboard_url, stop, idle))
+    timer.start()
+    time.sleep(args.baseline_seconds)
+    stop.set()
+    timer.join()
+
+    # 2. Dashboard while a burst of logins is running
+    busy, stop = [], threading.Event()
+    timer = threading.Thread(target=time_dashboard, args=(dashboard, dashboard_url, stop, busy))
+    remaining = list(range(args.logins))
+    lock = threading.Lock()
+
+    def login_client():
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                i = remaining.pop()
+            post_login(base_url, f'employee{i % 50}', 'secret')
+
+    clients = [threading.Thread(target=login_client) for _ in range(args.login_threads)]
+    started = time.perf_counter()
+    timer.start()
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    burst_seconds = time.perf_counter() - started
+    stop.set()
+    timer.join()
+    server.shutdown()
+
+    print(f"hash workers: {args.hash_workers}, {args.logins} logins from "
+          f"{args.login_threads} clients in {burst_seconds:.1f}s")
+    report("idle", idle)
+    report("login burst", busy)
+
+
+if __name__ == '__main__':
+    main()
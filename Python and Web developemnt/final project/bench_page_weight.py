@@ -0,0 +1,151 @@
+"""
+Benchmark: bytes on the wire and load time of the manager dashboard, on a
+first and a repeat visit, with and without compression and built assets.
+
+Loads the dashboard like a browser would: the page, the static files it
+links and the table fragments it fetches (data-fragment). Two setups:
+
+    before  no compression, static files from /static (revalidated
+            with a conditional request on every visit)
+    after   gzip for pages and JSON, built assets from /assets (cached
+            as immutable, so a repeat visit doesn't ask for them at all)
+
+A repeat visit sends If-None-Match for everything the first one got
+with an ETag and skips what it may keep (Cache-Control: immutable).
+
+The load time is modelled, since the test client has no network: the
+server time of each request plus one round trip per request (--rtt-ms,
+loaded --parallel at a time) plus the bytes at --mbps. Headers count as
+--header-bytes per request.
+
+Without DATABASE_URL a throwaway database is seeded with seed_data.py.
+
+Usage:
+    python bench_page_weight.py [--rtt-ms 50] [--mbps 10] [--parallel 6]
+    DATABASE_URL=sqlite:////tmp/big.db python bench_page_weight.py
+"""
+import argparse
+import gzip
+import html.parser
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class LinkParser(html.parser.HTMLParser):
+    """Collects the static files a page links and the fragments it loads."""
+
+    def __init__(self):
+        super().__init__()
+        self.assets, self.fragments = [], []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        for name in ('src', 'href'):
+            url = attrs.get(name) or ''
+            if url.startswith(('/static/', '/assets/')) and tag in ('script', 'link', 'img'):
+                self.assets.append(url)
+        if attrs.get('data-fragment'):
+            self.fragments.append(attrs['data-fragment'])
+
+
+def fetch(client, url, cache, accept_encoding):
+    """GET url like a browser with cache; return (body, requests, bytes, seconds)."""
+    cached = cache.get(url)
+    if cached and cached['immutable']:
+        return cached['body'], 0, 0, 0.0
+    headers = {'Accept-Encoding': accept_encoding}
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    started = time.perf_counter()
+    response = client.get(url, headers=headers)
+    seconds = time.perf_counter() - started
+    if response.status_code == 304:
+        return cached['body'], 1, 0, seconds
+    body = response.get_data()
+    if response.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    cache[url] = {
+        'body': body,
+        'etag': response.headers.get('ETag'),
+        'immutable': 'immutable' in response.headers.get('Cache-Control', ''),
+    }
+    return body, 1, len(response.data), seconds
+
+
+def visit(client, url, cache, accept_encoding):
+    """Load url and what it pulls in; return (requests, bytes, server seconds)."""
+    body, requests, wire_bytes, server_time = fetch(client, url, cache, accept_encoding)
+    links = LinkParser()
+    links.feed(body.decode('utf-8'))
+    for linked in links.assets + links.fragments:
+        _, linked_requests, linked_bytes, seconds = fetch(client, linked, cache, accept_encoding)
+        requests += linked_requests
+        wire_bytes += linked_bytes
+        server_time += seconds
+    return requests, wire_bytes, server_time
+
+
+def modelled_seconds(requests, wire_bytes, server_time, args):
+    # The page first, then the rest in rounds of --parallel requests
+    round_trips = (1 + math.ceil(max(requests - 1, 0) / args.parallel)) if requests else 0
+    total_bytes = wire_bytes + requests * args.header_bytes
+    return server_time + round_trips * args.rtt_ms / 1000 + total_bytes * 8 / (args.mbps * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard bytes and load time, first and repeat visit.")
+    parser.add_argument('--rtt-ms', type=float, default=50.0)
+    parser.add_argument('--mbps', type=float, default=10.0)
+    parser.add_argument('--parallel', type=int, default=6, help="requests a browser makes at a time")
+    parser.add_argument('--header-bytes', type=int, default=400)
+    parser.add_argument('--url', default='/manager/dashboard')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='1234')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+        print("Seeding a throwaway database...", flush=True)
+        subprocess.run([sys.executable, os.path.join(HERE, 'seed_data.py'),
+                        '--users', '2000', '--projects', '200', '--logs', '100000'],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    from app import app, build_assets
+    app.config['SLOW_QUERY_MS'] = float('inf')
+    build_assets(app)
+    built = dict(app.extensions['assets'])
+
+    print(f"GET {args.url}: RTT {args.rtt_ms:g} ms, {args.mbps:g} Mbit/s, {args.parallel} parallel requests")
+    print(f"{'setup':<7} {'visit':<7} {'requests':>8} {'KiB':>9} {'server ms':>9} {'load ms':>8}")
+    results = {}
+    for setup in ('before', 'after'):
+        app.extensions['assets'] = built if setup == 'after' else {}
+        # Cached pages link the assets of the other setup
+        app.extensions['page_cache'].clear()
+        accept_encoding = 'gzip, deflate, br' if setup == 'after' else 'identity'
+        client = app.test_client()
+        client.post('/login', data={'username': args.username, 'password': args.password})
+        cache = {}
+        # Warm up the page cache and templates; not a visit
+        visit(client, args.url, {}, accept_encoding)
+        for name in ('first', 'repeat'):
+            requests, wire_bytes, server_time = visit(client, args.url, cache, accept_encoding)
+            seconds = modelled_seconds(requests, wire_bytes, server_time, args)
+            results[setup, name] = (wire_bytes, seconds)
+            print(f"{setup:<7} {name:<7} {requests:8d} {wire_bytes / 1024:9.1f} "
+                  f"{server_time * 1000:9.1f} {seconds * 1000:8.1f}", flush=True)
+    for name in ('first', 'repeat'):
+        (bytes_before, before), (bytes_after, after) = results['before', name], results['after', name]
+        print(f"{name} visit: {bytes_before / 1024:.1f} -> {bytes_after / 1024:.1f} KiB, "
+              f"{before * 1000:.0f} -> {after * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: time entry latency while reports run, with and without the
+read snapshot (READ_SNAPSHOT).
+
+Writer processes keep posting /employee/log-hours and record how long
+each request takes; reporter processes keep downloading the full payroll
+export and the weekly report. Three runs on the same seeded database:
+
+    idle      writers only, no reports (the baseline)
+    live      reports read the live database (READ_SNAPSHOT off)
+    snapshot  reports read the read snapshot (READ_SNAPSHOT on)
+
+Also prints how large the write-ahead log grew: a checkpoint cannot get
+past a page that a long read on the live database may still need.
+
+Every process is a separate interpreter, so the numbers are about the
+database, not the GIL; on a machine with fewer cores than processes they
+also compete for the CPU.
+
+Usage:
+    python bench_read_snapshot.py [--writers 4] [--reporters 2] [--seconds 10]
+    python bench_read_snapshot.py --logs 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPORT_URLS = ['/manager/export-hours', '/manager/reports?period=week&group_by=user_project']
+
+
+def load_app(db_path, snapshot):
+    """Import the app (called in each child process)."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['READ_SNAPSHOT'] = '1' if snapshot else '0'
+    os.environ['READ_SNAPSHOT_PATH'] = db_path + '.snapshot'
+    # Logins are not what is measured here
+    os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    os.environ['SLOW_QUERY_MS'] = 'inf'
+    import app
+    app.app.logger.disabled = True
+    return app.app
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float('nan')
+
+
+def writer(db_path, snapshot, username, start, deadline, results):
+    test_client = load_app(db_path, snapshot).test_client()
+    test_client.post('/login', data={'username': username, 'password': 'secret'})
+    latencies, errors = [], 0
+    time.sleep(max(0, start - time.time()))
+    while time.time() < deadline:
+        started = time.perf_counter()
+        response = test_client.post('/employee/log-hours', data={
+            'date': '2025-01-14', 'hours': '1.5', 'project_id': '1'})
+        latencies.append(time.perf_counter() - started)
+        errors += response.status_code != 302
+    results.put(('writer', latencies, errors))
+
+
+def reporter(db_path, snapshot, start, deadline, results):
+    test_client = load_app(db_path, snapshot).test_client()
+    test_client.post('/login', data={'username': 'admin', 'password': '1234'})
+    latencies, errors = [], 0
+    time.sleep(max(0, start - time.time()))
+    while time.time() < deadline:
+        for url in REPORT_URLS:
+            started = time.perf_counter()
+            response = test_client.get(url)
+            response.get_data()
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+    results.put(('reporter', latencies, errors))
+
+
+def run(mode, db_path, usernames, reporters, seconds):
+    snapshot = mode == 'snapshot'
+    with sqlite3.connect(db_path) as conn:
+        # Start each run with an empty write-ahead log
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    # Time for the processes to start up and log in before the clock starts
+    start = time.time() + 5
+    deadline = start + seconds
+    processes = [ctx.Process(target=writer, args=(db_path, snapshot, name, start, deadline, results))
+                 for name in usernames]
+    if mode != 'idle':
+        processes += [ctx.Process(target=reporter, args=(db_path, snapshot, start, deadline, results))
+                      for _ in range(reporters)]
+    for p in processes:
+        p.start()
+
+    wal_path = db_path + '-wal'
+    max_wal = 0
+    time.sleep(max(0, start - time.time()))
+    while time.time() < deadline:
+        if os.path.exists(wal_path):
+            max_wal = max(max_wal, os.path.getsize(wal_path))
+        time.sleep(0.1)
+
+    latencies = {'writer': [], 'reporter': []}
+    errors = 0
+    for _ in processes:
+        role, role_latencies, role_errors = results.get()
+        latencies[role] += role_latencies
+        errors += role_errors
+    for p in processes:
+        p.join()
+
+    writes, reports = latencies['writer'], latencies['reporter']
+    print(f"{mode:<9} {len(writes) / seconds:8.1f} {percentile(writes, 50) * 1000:8.1f} "
+          f"{percentile(writes, 99) * 1000:8.1f} {max(writes, default=0) * 1000:8.1f} "
+          f"{len(reports) / seconds:9.2f} {max_wal / 2**20:7.1f} {errors:6d}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write latency while reports run, live vs snapshot.")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--reporters', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--logs', type=int, default=300000, help="time logs in the seeded database")
+    parser.add_argument('--modes', default='idle,live,snapshot')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path, PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    print(f"Seeding a throwaway database with {args.logs} time logs...", flush=True)
+    subprocess.run([sys.executable, os.path.join(HERE, 'seed_data.py'), '--users', '200',
+                    '--projects', '20', '--logs', str(args.logs)],
+                   check=True, stdout=subprocess.DEVNULL, env=env)
+    with sqlite3.connect(db_path) as conn:
+        usernames = [name for name, in conn.execute(
+            "SELECT username FROM user WHERE role = 'employee' ORDER BY id LIMIT ?", (args.writers,))]
+
+    print(f"{os.cpu_count()} CPUs, {args.writers} writers, {args.reporters} reporters, {args.seconds:g}s per run")
+    print(f"{'mode':<9} {'writes/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'reports/s':>9} {'WAL MB':>7} {'errors':>6}")
+    for mode in args.modes.split(','):
+        run(mode, db_path, usernames, args.reporters, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
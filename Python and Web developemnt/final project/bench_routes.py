@@ -0,0 +1,302 @@
+"""
+Load test: latency, throughput and queries per request of the main routes.
+
+Runs every scenario below at each concurrency level for a fixed time, with
+one logged-in client per worker thread. Clients are Flask test clients by
+default, or real HTTP clients against a local threaded server (--server).
+Prints p50 / p95 / p99 latency, requests per second and SQL statements
+per request (from the app's own metrics), and saves everything as JSON so
+a later run can be compared with --compare.
+
+Without DATABASE_URL a throwaway database is seeded with seed_data.py
+first; point DATABASE_URL at a database seeded at the size you care about
+for meaningful numbers.
+
+Usage:
+    python bench_routes.py [--concurrency 1,4,16] [--seconds 5] [--server]
+    DATABASE_URL=sqlite:////tmp/big.db python bench_routes.py --output big.json
+    python bench_routes.py --compare big.json --only manager_dashboard,api_time_logs
+    python bench_routes.py --during-export --compare big.json   # with an export job running
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime
+from http.cookiejar import CookieJar
+
+if 'DATABASE_URL' not in os.environ:
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    # Logging in is not what is measured here
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    print("Seeding a throwaway database...", flush=True)
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), 'seed_data.py'),
+                    '--users', '200', '--projects', '20', '--logs', '50000'],
+                   check=True, stdout=subprocess.DEVNULL)
+
+from werkzeug.serving import make_server
+
+from app import app, db, User, Project, TimeLog, Job, metrics, submit_job, JOB_FINISHED
+
+# name -> (who, method, url); employee scenarios use one employee per worker
+SCENARIOS = {
+    'manager_dashboard': ('admin', 'GET', '/manager/dashboard'),
+    'manager_employees': ('admin', 'GET', '/manager/dashboard/employees'),
+    'manager_pending': ('admin', 'GET', '/manager/dashboard/pending'),
+    'manager_reports': ('admin', 'GET', '/manager/reports?period=month&group_by=project'),
+    'api_time_logs': ('admin', 'GET', '/api/time-logs?approved=0&limit=100'),
+    'api_summary': ('admin', 'GET', '/api/summary'),
+    'employee_dashboard': ('employee', 'GET', '/employee/dashboard'),
+    'employee_log_hours': ('employee', 'POST', '/employee/log-hours'),
+}
+
+
+class TestClient:
+    """Logged-in Flask test client."""
+
+    def __init__(self, base_url, username, password):
+        self.client = app.test_client()
+        self.client.post('/login', data={'username': username, 'password': password})
+
+    def request(self, method, url, data=None):
+        response = self.client.open(url, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """Logged-in urllib client talking to the local server."""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect)
+        self.request('POST', '/login', {'username': username, 'password': password})
+
+    def request(self, method, url, data=None):
+        body = urllib.parse.urlencode(data).encode() if method == 'POST' else None
+        try:
+            with self.opener.open(self.base_url + url, data=body) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            # Redirects after a POST end up here
+            return e.code
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def worker(make_client, base_url, scenario, credentials, deadline, samples, errors):
+    _, method, url = SCENARIOS[scenario]
+    username, password, project_id = credentials
+    client = make_client(base_url, username, password)
+    data = None
+    if method == 'POST':
+        data = {'date': date.today().isoformat(), 'hours': '1.5', 'project_id': str(project_id)}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status = client.request(method, url, data)
+        samples.append(time.perf_counter() - started)
+        if status >= 400 or (method == 'GET' and status != 200):
+            errors.append(status)
+
+
+def endpoint_sql(endpoint):
+    stats = metrics.totals().get(endpoint)
+    return (stats.count, stats.sql_count) if stats else (0, 0)
+
+
+def run_scenario(make_client, base_url, scenario, concurrency, seconds, employees, admin_password):
+    who = SCENARIOS[scenario][0]
+    if who == 'admin':
+        credentials = [('admin', admin_password, None)] * concurrency
+    else:
+        credentials = [employees[i % len(employees)] for i in range(concurrency)]
+
+    _, method, url = SCENARIOS[scenario]
+    endpoint, _ = app.url_map.bind('localhost').match(urllib.parse.urlsplit(url).path, method=method)
+    requests_before, sql_before = endpoint_sql(endpoint)
+
+    samples, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=worker, args=(
+        make_client, base_url, scenario, credentials[i], deadline, samples, errors))
+        for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    requests_after, sql_after = endpoint_sql(endpoint)
+    handled = requests_after - requests_before
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(errors),
+        'throughput': len(samples) / elapsed,
+        'p50_ms': percentile(samples, 50) * 1000 if samples else None,
+        'p95_ms': percentile(samples, 95) * 1000 if samples else None,
+        'p99_ms': percentile(samples, 99) * 1000 if samples else None,
+        'queries_per_request': (sql_after - sql_before) / handled if handled else None,
+    }
+
+
+def keep_exporting(stop):
+    """Run payroll export jobs back to back until stop is set."""
+    with app.app_context():
+        while not stop.is_set():
+            job_id = submit_job('export_hours')
+            while not stop.is_set():
+                db.session.expire_all()
+                if db.session.get(Job, job_id).status in JOB_FINISHED:
+                    break
+                time.sleep(0.2)
+            db.session.rollback()
+
+
+def dataset_size():
+    with app.app_context():
+        return {
+            'users': db.session.scalar(db.select(db.func.count()).select_from(User)),
+            'projects': db.session.scalar(db.select(db.func.count()).select_from(Project)),
+            'time_logs': db.session.scalar(db.select(db.func.count()).select_from(TimeLog)),
+        }
+
+
+def load_employees(count, password):
+    """(username, password, project_id) for employees that have a project."""
+    with app.app_context():
+        rows = db.session.execute(
+            db.select(User.username, db.func.min(Project.id))
+                .join(User.projects)
+                .where(User.role != 'admin')
+                .group_by(User.id)
+                .order_by(User.id)
+                .limit(count)
+        ).all()
+    return [(username, password, project_id) for username, project_id in rows]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def fmt(value, width=8, digits=1):
+    return f"{value:{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+
+
+def print_results(results, previous=None):
+    before = {(r['scenario'], r['concurrency']): r for r in previous or []}
+    print(f"{'scenario':<20} {'conc':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'sql/req':>7} {'errors':>6}" + ("   vs previous" if previous else ""))
+    for r in results:
+        line = (f"{r['scenario']:<20} {r['concurrency']:4d} {fmt(r['throughput'])} "
+                f"{fmt(r['p50_ms'])} {fmt(r['p95_ms'])} {fmt(r['p99_ms'])} "
+                f"{fmt(r['queries_per_request'], 7)} {r['errors']:6d}")
+        old = before.get((r['scenario'], r['concurrency']))
+        if old and old['throughput'] and old['p99_ms']:
+            line += (f"   req/s {r['throughput'] / old['throughput'] - 1:+6.0%}"
+                     f"  p99 {r['p99_ms'] / old['p99_ms'] - 1:+6.0%}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the main routes.")
+    parser.add_argument('--concurrency', default='1,4,16',
+                        help="comma-separated numbers of concurrent clients")
+    parser.add_argument('--seconds', type=float, default=5.0, help="duration of each run")
+    parser.add_argument('--only', help="comma-separated scenarios to run (default: all)")
+    parser.add_argument('--server', action='store_true',
+                        help="go through a local threaded HTTP server instead of the test client")
+    parser.add_argument('--employee-password', default='secret')
+    parser.add_argument('--admin-password', default='1234')
+    parser.add_argument('--during-export', action='store_true',
+                        help="keep a full payroll export job running in the background")
+    parser.add_argument('--output', help="where to save the results (default: bench-<time>.json)")
+    parser.add_argument('--compare', help="results file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.concurrency.split(',')]
+    scenarios = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    employees = load_employees(max(levels), args.employee_password)
+    random.Random(0).shuffle(employees)
+
+    base_url, server = None, None
+    make_client = TestClient
+    if args.server:
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        make_client = HTTPClient
+
+    stop_exports = threading.Event()
+    if args.during_export:
+        threading.Thread(target=keep_exporting, args=(stop_exports,), daemon=True).start()
+
+    started = datetime.now()
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            result = run_scenario(make_client, base_url, scenario, concurrency,
+                                  args.seconds, employees, args.admin_password)
+            results.append(result)
+            print(f"  {scenario} x{concurrency}: {result['requests']} requests", flush=True)
+    stop_exports.set()
+    if server:
+        server.shutdown()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)['results']
+    print_results(results, previous)
+
+    output = args.output or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'started': started.isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'client': 'http' if args.server else 'test_client',
+            'during_export': args.during_export,
+            'seconds': args.seconds,
+            'dataset': dataset_size(),
+            'results': results,
+        }, f, indent=2)
+    print(f"Saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: concurrent time-log writers and dashboard readers on SQLite.
+
+Runs separate processes that each use the app through the Flask test
+client: writers keep posting /employee/log-hours, readers keep loading
+/employee/dashboard. It reports throughput and the number of failed
+requests ("database is locked") for two engine setups on a fresh database:
+
+    before  SQLite defaults (rollback journal, synchronous=FULL)
+    after   the app's configured settings (WAL, synchronous=NORMAL, ...)
+
+Usage:
+    python bench_sqlite_concurrency.py [--writers N] [--readers N] [--seconds S]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+MODES = {
+    # Empty values and 0 keep SQLite's own defaults; the busy timeout stays
+    # at the sqlite3 module's default of 5 seconds
+    'before': {
+        'SQLITE_JOURNAL_MODE': '',
+        'SQLITE_SYNCHRONOUS': '',
+        'SQLITE_BUSY_TIMEOUT_MS': '0',
+        'SQLITE_CACHE_SIZE_KB': '0',
+    },
+    # Use the defaults from app.py
+    'after': {},
+}
+
+
+def load_app(db_path, mode):
+    """Import the app configured for mode (called in each child process)."""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    # Logins are not what is measured here
+    os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    os.environ.update(MODES[mode])
+    import app
+    return app
+
+
+def prepare(db_path, mode, employees):
+    app_module = load_app(db_path, mode)
+    app, db = app_module.app, app_module.db
+    with app.app_context():
+        app_module.init_db()
+        project = app_module.Project(name='benchmark')
+        password = app_module.hash_password('secret')
+        users = [app_module.User(username=f'employee{i}', password=password)
+                 for i in range(employees)]
+        for user in users:
+            user.projects.append(project)
+        db.session.add_all(users)
+        db.session.commit()
+
+
+def client(db_path, mode, role, number, seconds, results):
+    app_module = load_app(db_path, mode)
+    app = app_module.app
+    app.logger.disabled = True
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': f'employee{number}', 'password': 'secret'})
+
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if role == 'writer':
+                response = test_client.post('/employee/log-hours', data={
+                    'date': '2025-01-14', 'hours': '1.5', 'project_id': '1'})
+                ok = response.status_code == 302
+            else:
+                response = test_client.get('/employee/dashboard')
+                ok = response.status_code == 200
+        except Exception:
+            ok = False
+        if ok:
+            done += 1
+        else:
+            errors += 1
+    results.put((role, done, errors))
+
+
+def run(mode, writers, readers, seconds):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    ctx = multiprocessing.get_context('spawn')
+    setup = ctx.Process(target=prepare, args=(db_path, mode, writers + readers))
+    setup.start()
+    setup.join()
+
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=client, args=(db_path, mode, role, number, seconds, results))
+        for number, role in enumerate(['writer'] * writers + ['reader'] * readers)
+    ]
+    for p in processes:
+        p.start()
+    totals = {'writer': [0, 0], 'reader': [0, 0]}
+    for _ in processes:
+        role, done, errors = results.get()
+        totals[role][0] += done
+        totals[role][1] += errors
+    for p in processes:
+        p.join()
+
+    for role, (done, errors) in totals.items():
+        print(f"{mode:>6}  {role}s: {done / seconds:8.1f} req/s  {errors:5d} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite concurrent writer/reader benchmark.")
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--mode', choices=list(MODES), help="run only one mode")
+    args = parser.parse_args()
+
+    for mode in [args.mode] if args.mode else list(MODES):
+        run(mode, args.writers, args.readers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
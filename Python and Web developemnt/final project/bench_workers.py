@@ -0,0 +1,155 @@
+"""
+Benchmark: throughput of serve.py with 1, 2, 4, ... worker processes.
+
+Starts serve.py with each worker count in turn and loads one URL as fast
+as possible from --clients concurrent connections for --seconds, then
+prints requests per second, latency and the speedup over one worker.
+
+The load comes from separate client processes on the same machine, so
+they compete with the server for the CPUs: the speedup can't go past
+the number of cores, and flattens out before that. Run it on a machine
+with a few cores to see the scaling (the core count is printed).
+
+Without DATABASE_URL a throwaway database is seeded with seed_data.py.
+
+Usage:
+    python bench_workers.py [--workers 1,2,4] [--clients 16] [--seconds 10]
+    python bench_workers.py --url '/manager/reports?period=week&group_by=employee'
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"serve.py did not start listening on port {port}")
+
+
+def login(port, username, password):
+    """Return the session cookie of a fresh login."""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/login', urllib.parse.urlencode({'username': username, 'password': password}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f"Login failed ({response.status})")
+    return cookie.split(';', 1)[0]
+
+
+def client(port, url, cookie, deadline, results):
+    """Request url until the deadline; put the latencies on results."""
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        # The dev server closes the connection after each response
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        conn.request('GET', url, headers={'Cookie': cookie})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        latencies.append(time.perf_counter() - started)
+        if response.status != 200:
+            errors += 1
+    results.put((latencies, errors))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(workers, args):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'serve.py'), '--workers', str(workers),
+                               '--port', str(port), '--quiet'], stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        cookie = login(port, args.username, args.password)
+        # Warm up the workers (connection pools, templates)
+        warm = multiprocessing.Queue()
+        client(port, args.url, cookie, time.perf_counter() + 1, warm)
+        warm.get()
+
+        results = multiprocessing.Queue()
+        deadline = time.perf_counter() + args.seconds
+        clients = [multiprocessing.Process(target=client, args=(port, args.url, cookie, deadline, results))
+                   for _ in range(args.clients)]
+        started = time.perf_counter()
+        for p in clients:
+            p.start()
+        latencies, errors = [], 0
+        for _ in clients:
+            client_latencies, client_errors = results.get()
+            latencies += client_latencies
+            errors += client_errors
+        elapsed = time.perf_counter() - started
+        for p in clients:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of serve.py by number of workers.")
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated worker counts")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client processes")
+    parser.add_argument('--seconds', type=float, default=10.0, help="duration of each run")
+    parser.add_argument('--url', default='/api/time-logs?approved=0&limit=100')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='1234')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        # Logging in is not what is measured here
+        os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+        print("Seeding a throwaway database...", flush=True)
+        subprocess.run([sys.executable, os.path.join(HERE, 'seed_data.py'),
+                        '--users', '200', '--projects', '20', '--logs', '50000'],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} clients, {args.seconds:g}s per run, GET {args.url}")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} {'speedup':>7}")
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(',')]:
+        r = run(workers, args)
+        baseline = baseline or r['throughput']
+        print(f"{r['workers']:7d} {r['throughput']:8.1f} {r['p50_ms']:8.1f} {r['p99_ms']:8.1f} "
+              f"{r['errors']:6d} {r['throughput'] / baseline:6.2f}x", flush=True)
+
+
+if __name__ == '__main__':
+    main()
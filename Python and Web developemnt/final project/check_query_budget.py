@@ -0,0 +1,96 @@
+"""
+Query-budget check for the rendered routes.
+
+Seeds a throwaway database (the same data as check_query_plans.py), renders
+each page through the Flask test client and counts the SQL statements the
+request issued. Exits with status 1 if a route goes over the budget it
+declares with @query_budget in app.py, or declares none.
+
+Usage:
+    python check_query_budget.py
+"""
+import sys
+from urllib.parse import urlsplit
+
+# Importing check_query_plans points the app at a temporary database
+from check_query_plans import seed
+
+from sqlalchemy import event
+
+from app import app, db, User, Project
+
+
+def count_queries(client, url):
+    """Request url and return (endpoint, number of SQL statements issued)."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    endpoint, _ = app.url_map.bind('localhost').match(urlsplit(url).path)
+    return endpoint, len(statements)
+
+
+def main():
+    with app.app_context():
+        seed()
+        employee = User.query.filter_by(username='employee9').first()
+        project = Project.query.first()
+        pages = {
+            'admin': [
+                '/manager/dashboard',
+                '/manager/dashboard/employees',
+                '/manager/dashboard/employees?after=3',
+                '/manager/dashboard/projects',
+                '/manager/dashboard/pending',
+                '/manager/dashboard/pending?after=2025-01-04.2',
+                '/manager/dashboard/project-options',
+                '/manager/add-hour',
+                f'/manager/edit-employee/{employee.id}',
+                f'/manager/edit-project/{project.id}',
+                '/manager/reports?period=month&group_by=user_project',
+                '/api/employees?fields=username,hours_worked',
+                '/api/projects',
+                '/api/time-logs?approved=0&limit=20',
+                '/api/summary',
+                '/api/search?q=employee',
+                '/manager/jobs',
+            ],
+            'employee9': [
+                '/employee/dashboard',
+                '/employee/dashboard?after=2025-01-10.150',
+                '/employee/edit-profile',
+            ],
+        }
+        passwords = {'admin': '1234', 'employee9': 'test'}
+
+        failures = 0
+        for username, urls in pages.items():
+            client = app.test_client()
+            client.post('/login', data={'username': username, 'password': passwords[username]})
+            for url in urls:
+                endpoint, count = count_queries(client, url)
+                budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+                if budget is None:
+                    status = 'NO BUDGET'
+                elif count > budget:
+                    status = 'OVER BUDGET'
+                else:
+                    status = 'ok'
+                if status != 'ok':
+                    failures += 1
+                print(f"{status:>11}  {count:3d} / {budget if budget is not None else '-':>3}  {url}")
+
+    print(f"{failures} route(s) failed the query budget check.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
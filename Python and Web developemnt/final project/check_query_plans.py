@@ -0,0 +1,150 @@
+"""
+Query-plan regression check for the dashboard queries.
+
+Seeds a throwaway database, renders the dashboards through the Flask test
+client, records every query they issue and runs EXPLAIN QUERY PLAN on it.
+Exits with status 1 if any of them scans a whole history table instead of
+using an index.
+
+Usage:
+    python check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Point the app at a temporary database before it is imported
+tmp_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'plans.db')
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import (app, db, User, Project, TimeLog, init_db, reconcile_totals, rebuild_rollups,
+                 archive_time_logs, ARCHIVE_PREFIX)
+
+# Tables that grow with the company's history: a full scan of one of these
+# is always a regression. The user and project lists are read in full on
+# purpose by the manager dashboard, so they are not checked here. The
+# per-year archive tables (time_log_archive_<year>) are history too.
+HISTORY_TABLES = {'time_log', 'employee_projects', 'hours_rollup'}
+
+
+def seed():
+    """Create a few employees, projects and a couple of hundred time logs,
+    and archive the ones from 2024."""
+    init_db()
+    password = generate_password_hash('test', method='pbkdf2:sha256')
+    projects = [Project(name=f'project {i}') for i in range(5)]
+    users = [User(username=f'employee{i}', password=password) for i in range(10)]
+    db.session.add_all(projects + users)
+    db.session.flush()
+    for i, user in enumerate(users):
+        user.projects = projects[:1 + i % len(projects)]
+        for day in range(-10, 20):
+            db.session.add(TimeLog(
+                user_id=user.id,
+                project_id=projects[day % len(projects)].id,
+                log_date=date(2025, 1, 1) + timedelta(days=day),
+                hours=8.0,
+                approved=day % 3 != 0
+            ))
+    db.session.commit()
+    reconcile_totals()
+    rebuild_rollups()
+    archive_time_logs(date(2025, 1, 1))
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def capture_queries():
+    """Render each dashboard and return the distinct queries it issued."""
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE')):
+            statements.setdefault(statement, parameters)
+
+    client = app.test_client()
+    employee_id = User.query.filter_by(username='employee9').first().id
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        client.post('/login', data={'username': 'admin', 'password': '1234'})
+        client.get('/manager/dashboard')
+        client.get('/manager/dashboard/employees')
+        client.get('/manager/dashboard/employees?after=3')
+        client.get('/manager/dashboard/projects?after=2')
+        client.get('/manager/dashboard/pending')
+        client.get('/manager/dashboard/pending?after=2025-01-04.2')
+        client.get('/manager/dashboard/project-options')
+        client.get('/manager/add-hour')
+        client.get(f'/manager/edit-employee/{employee_id}')
+        client.post('/manager/assign-projects', data={
+            'user_ids': [employee_id, employee_id - 1], 'project_ids': ['1', '2'], 'mode': 'set'})
+        client.post('/manager/approve-hours', data={'user_id': employee_id, 'date_to': '2025-01-05'})
+        client.get('/manager/export-hours?date_from=2025-01-05&date_to=2025-01-10').get_data()
+        client.get(f'/manager/export-hours?user_id={employee_id}').get_data()
+        client.get('/manager/export-hours?project_id=2&date_to=2024-12-31').get_data()
+        client.get('/manager/reports?period=week&group_by=user_project&date_from=2025-01-06')
+        client.get('/api/employees?fields=username,hours_worked&limit=3&after=2')
+        client.get('/api/projects?format=rows')
+        client.get('/api/time-logs?limit=20&after=2025-01-04.2')
+        client.get(f'/api/time-logs?user_id={employee_id}&approved=0')
+        client.get('/api/time-logs?approved=1&date_from=2025-01-05&fields=hours')
+        client.get('/api/summary')
+        client.get('/api/search?q=proj emp')
+        client.post(f'/manager/delete-employee/{employee_id - 3}', data={'logs': 'archive'})
+        client.post(f'/manager/delete-employee/{employee_id - 4}',
+                    data={'logs': 'reassign', 'reassign_to': employee_id - 5})
+        client.post(f'/manager/delete-employee/{employee_id - 6}', data={'logs': 'delete'})
+        client.post('/manager/delete-project/5', data={'logs': 'archive'})
+        client.post('/manager/delete-project/4', data={'logs': 'reassign', 'reassign_to': 3})
+        client.get('/logout')
+
+        client.post('/login', data={'username': 'employee9', 'password': 'test'})
+        client.get('/employee/dashboard')
+        client.get('/employee/dashboard?after=2025-01-10.150&pending_after=2025-01-10.150')
+
+        with app.app_context():
+            reconcile_totals()
+            archive_time_logs(date(2025, 1, 3), batch_size=20)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def full_scans(plan):
+    """Return the plan lines that read a whole history table."""
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        words = detail.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and (
+                words[1] in HISTORY_TABLES or words[1].startswith(ARCHIVE_PREFIX)):
+            scans.append(detail)
+    return scans
+
+
+def main():
+    with app.app_context():
+        seed()
+        statements = capture_queries()
+
+        failures = 0
+        with db.engine.connect() as conn:
+            for statement, parameters in statements.items():
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                scans = full_scans(plan)
+                if scans:
+                    failures += 1
+                    print('FULL SCAN:', ' '.join(statement.split()))
+                    for detail in scans:
+                        print('    ', detail)
+
+    print(f"{len(statements)} queries checked, {failures} with a full table scan.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
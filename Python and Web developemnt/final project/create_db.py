@@ -1,11 +1,12 @@
-from app import db, create_admin
+from app import init_db, reconcile_totals, rebuild_rollups
 
 # Create the application context
 from app import app
 
 with app.app_context():
-    # Create all tables
-    db.create_all()
-    # Create the admin user
-    create_admin()
+    # Create all tables, any indexes missing from an older database and the admin user
+    init_db()
+    # Make sure the approved-hour counters and rollups match the existing time logs
+    reconcile_totals()
+    rebuild_rollups()
     print("Database and admin user created successfully!")
@@ -0,0 +1,44 @@
+"""
+Import time logs from a CSV or JSON-lines file into the database.
+
+Usage:
+    python import_logs.py hours.csv
+    python import_logs.py badge_reader.jsonl --batch-size 50000
+
+The file is streamed, so it can be much larger than memory. See
+import_time_logs() in app.py for the expected columns.
+"""
+import argparse
+import time
+
+from app import app, import_time_logs, read_csv_rows, read_jsonl_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import time logs.")
+    parser.add_argument('path', help="CSV or JSON-lines file to import")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="file format (default: guessed from the extension)")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="rows per insert batch (default: IMPORT_BATCH_SIZE)")
+    args = parser.parse_args()
+
+    file_format = args.format
+    if file_format is None:
+        is_jsonl = args.path.lower().endswith(('.jsonl', '.json', '.ndjson'))
+        file_format = 'jsonl' if is_jsonl else 'csv'
+
+    started = time.perf_counter()
+    with open(args.path, encoding='utf-8', newline='') as f, app.app_context():
+        rows = read_jsonl_rows(f) if file_format == 'jsonl' else read_csv_rows(f)
+        result = import_time_logs(rows, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    for error in result['errors']:
+        print("Rejected", error)
+    print(f"Accepted {result['accepted']} rows, rejected {result['rejected']} "
+          f"in {elapsed:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Fill the database with a synthetic organisation for load testing.
+
+Creates employees with personal details, projects, the employee_projects
+assignments and time logs spread over the last --days days, then rebuilds
+the approved-hour counters and rollups. Everything is inserted with Core
+executemany batches; the TimeLog indexes are dropped during the load and
+created again at the end, which is much faster than maintaining them row
+by row.
+
+The data is random but reproducible (--seed). Roughly like a real company:
+most employees work on a few projects, log close to a full day on workdays,
+and almost everything older than two weeks has been approved while recent
+logs are mostly still pending.
+
+Usage:
+    python seed_data.py                                   # small default org
+    python seed_data.py --users 50000 --projects 5000 --logs 20000000
+    DATABASE_URL=sqlite:////tmp/big.db python seed_data.py --logs 1000000
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from app import (app, db, User, Project, TimeLog, employee_projects,
+                 init_db, hash_password, reconcile_totals, rebuild_rollups)
+
+FIRST_NAMES = ['Anna', 'Bram', 'Chloe', 'Daan', 'Emma', 'Finn', 'Julia', 'Lars',
+               'Lotte', 'Milan', 'Noah', 'Sara', 'Sem', 'Tess', 'Thijs', 'Zoe']
+LAST_NAMES = ['Bakker', 'de Boer', 'Dekker', 'Jansen', 'de Jong', 'Janssen',
+              'Meijer', 'Mulder', 'Peters', 'Smit', 'Visser', 'de Vries']
+STREETS = ['Markt', 'Vrijthof', 'Stationsstraat', 'Wycker Brugstraat',
+           'Boschstraat', 'Tongerseweg', 'Meerssenerweg', 'Brusselsestraat']
+# Hours per log and how often they occur: mostly full days
+HOURS = [8.0, 7.5, 6.0, 4.0, 8.5, 2.0, 1.5, 9.0]
+HOURS_WEIGHTS = [50, 12, 10, 10, 6, 5, 4, 3]
+# Logs newer than this are only approved with --recent-approved-ratio
+RECENT_DAYS = 14
+
+
+def insert_batches(table, rows, batch_size):
+    """executemany rows (an iterable of dicts) into table, committing per batch."""
+    insert = table.insert()
+    batch, total = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert, batch)
+            db.session.commit()
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+        db.session.commit()
+        total += len(batch)
+    return total
+
+
+def generate_users(rng, count, first_id, password):
+    for i in range(count):
+        yield {
+            'id': first_id + i,
+            'username': f'employee{first_id + i}',
+            'password': password,
+            'role': 'employee',
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'phone': f'+31 6 {rng.randrange(10**8):08d}',
+            'address': f'{rng.choice(STREETS)} {rng.randint(1, 200)}, Maastricht',
+            'birthdate': date(1960, 1, 1) + timedelta(days=rng.randrange(365 * 45)),
+            'hours_worked': 0.0,
+        }
+
+
+def generate_projects(rng, count, first_id):
+    for i in range(count):
+        yield {
+            'id': first_id + i,
+            'name': f'project {first_id + i}',
+            'description': f'Synthetic project for {rng.choice(LAST_NAMES)} B.V.',
+            'total_hours': 0.0,
+        }
+
+
+def assign_projects(rng, user_ids, project_ids, per_user):
+    """Return {user_id: [project_id, ...]}, per_user projects on average."""
+    assignments = {}
+    for user_id in user_ids:
+        count = max(1, min(len(project_ids), round(rng.expovariate(1 / per_user))))
+        assignments[user_id] = rng.sample(project_ids, count)
+    return assignments
+
+
+def generate_logs(rng, assignments, count, days, approved_ratio, recent_approved_ratio):
+    """Yield count TimeLog rows for random users on one of their projects."""
+    user_ids = list(assignments)
+    today = date.today()
+    # Only workdays in the window
+    workdays = [today - timedelta(days=d) for d in range(days)
+                if (today - timedelta(days=d)).weekday() < 5]
+    for _ in range(count):
+        user_id = rng.choice(user_ids)
+        log_date = rng.choice(workdays)
+        recent = (today - log_date).days < RECENT_DAYS
+        yield {
+            'user_id': user_id,
+            'project_id': rng.choice(assignments[user_id]),
+            'log_date': log_date,
+            'hours': rng.choices(HOURS, HOURS_WEIGHTS)[0],
+            'approved': rng.random() < (recent_approved_ratio if recent else approved_ratio),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with synthetic data.")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--projects', type=int, default=50)
+    parser.add_argument('--logs', type=int, default=100000)
+    parser.add_argument('--projects-per-user', type=float, default=3.0,
+                        help="average number of projects an employee is assigned to")
+    parser.add_argument('--days', type=int, default=730, help="spread logs over this many days")
+    parser.add_argument('--approved-ratio', type=float, default=0.97,
+                        help="share of approved logs older than two weeks")
+    parser.add_argument('--recent-approved-ratio', type=float, default=0.3,
+                        help="share of approved logs from the last two weeks")
+    parser.add_argument('--password', default='secret', help="password of every generated employee")
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+
+    def step(message):
+        print(f"{time.perf_counter() - started:7.1f}s  {message}", flush=True)
+
+    # The bulk statements are expected to be slow; don't log each of them
+    app.config['SLOW_QUERY_MS'] = float('inf')
+
+    with app.app_context():
+        init_db()
+        # Start after whatever is already there, so seeding twice adds more
+        first_user = (db.session.scalar(db.select(db.func.max(User.id))) or 0) + 1
+        first_project = (db.session.scalar(db.select(db.func.max(Project.id))) or 0) + 1
+
+        # Every employee gets the same password, so it is hashed only once
+        password = hash_password(args.password)
+        insert_batches(User.__table__, generate_users(rng, args.users, first_user, password),
+                       args.batch_size)
+        insert_batches(Project.__table__, generate_projects(rng, args.projects, first_project),
+                       args.batch_size)
+        step(f"{args.users} employees and {args.projects} projects")
+
+        user_ids = list(range(first_user, first_user + args.users))
+        project_ids = list(range(first_project, first_project + args.projects))
+        assignments = assign_projects(rng, user_ids, project_ids, args.projects_per_user)
+        total = insert_batches(employee_projects, (
+            {'user_id': user_id, 'project_id': project_id}
+            for user_id, projects in assignments.items() for project_id in projects
+        ), args.batch_size)
+        step(f"{total} project assignments")
+
+        indexes = list(TimeLog.__table__.indexes)
+        for index in indexes:
+            index.drop(bind=db.engine, checkfirst=True)
+        logs = generate_logs(rng, assignments, args.logs, args.days,
+                             args.approved_ratio, args.recent_approved_ratio)
+        insert_batches(TimeLog.__table__, logs, args.batch_size)
+        step(f"{args.logs} time logs")
+        for index in indexes:
+            index.create(bind=db.engine, checkfirst=True)
+        step("time log indexes")
+
+        reconcile_totals()
+        rebuild_rollups()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        step("approved-hour totals, rollups and statistics")
+
+
+if __name__ == '__main__':
+    main()
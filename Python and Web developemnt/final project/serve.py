@@ -0,0 +1,141 @@
+"""
+Serve the app from several worker processes (pre-fork).
+
+One Python process can only keep one core busy (the GIL), whatever the
+number of threads. This script sets up the database, opens the listening
+socket and then forks --workers processes that all accept connections on
+it, each serving its requests on threads. A worker that dies is replaced;
+Ctrl-C or SIGTERM stops them all.
+
+Static files are built (see `flask build-assets`) before the workers
+start, so they are always served fingerprinted and pre-compressed.
+
+Every worker has its own database connections, password hashing pool and
+background job pool. Connections opened before the fork are dropped in
+each worker. Jobs left running by a stopped server are queued again once,
+here, before any worker starts. After that any worker can pick up queued
+jobs (each is claimed by one).
+
+Settings come from the environment or a config file like for the app
+itself, e.g.:
+
+    SECRET_KEY=... DATABASE_URL=sqlite:////srv/timesheet.db python serve.py --workers 4
+    APP_CONFIG_FILE=/etc/timesheet.cfg python serve.py --port 8080
+
+The factory also works with other pre-forking servers, as long as each
+worker creates its own app. Those don't set up the database, so run
+`flask init-db` once first (also after an upgrade, for new tables and
+indexes):
+
+    flask --app app init-db && gunicorn -w 4 'app:create_app()'
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+
+from werkzeug.serving import make_server
+
+from app import build_assets, create_app, db, init_db, requeue_interrupted_jobs, start_queued_jobs
+
+
+def open_socket(host, port, backlog=1024):
+    sock = socket.create_server((host, port), backlog=backlog)
+    # All workers wait on the same socket; the ones that lose the race for
+    # a connection must not block in accept()
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, quiet):
+    """Body of a worker process: serve requests until told to stop."""
+    # Stop the same way as on Ctrl-C: serve_forever() returns
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if quiet:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    with app.app_context():
+        # Forget (without closing) the parent's connections; they belong to it
+        db.engine.dispose(close=False)
+        start_queued_jobs()
+    server = make_server(sock.getsockname()[0], sock.getsockname()[1], app,
+                         threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+def spawn(app, sock, quiet):
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        run_worker(app, sock, quiet)
+    except BaseException:
+        logging.getLogger(__name__).exception("Worker %s crashed", os.getpid())
+        status = 1
+    finally:
+        # Never fall back into the master's code
+        os._exit(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app from several processes.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--quiet', action='store_true', help="don't log every request")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(message)s')
+    log = logging.getLogger(__name__)
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        requeued = requeue_interrupted_jobs()
+        if requeued:
+            log.info("Queued %d interrupted job(s) again", requeued)
+        db.engine.dispose()
+    built = build_assets(app)
+    if built:
+        log.info("Built %d static file(s)", built)
+
+    sock = open_socket(args.host, args.port)
+    log.info("Listening on http://%s:%d with %d workers", args.host, args.port, args.workers)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    workers = set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        workers.add(spawn(app, sock, args.quiet))
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            log.warning("Worker %d exited (%d), starting a new one",
+                        pid, os.waitstatus_to_exitcode(status))
+            workers.add(spawn(app, sock, args.quiet))
+    sock.close()
+    log.info("Stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+// Manager dashboard: loads the table fragments and fills the project selects.
+//
+// - Every element with data-fragment="<url>" is filled with that URL's HTML
+//   when it scrolls into view. "Next page" / "First page" links inside it
+//   (data-fragment-link) load into the same element instead of navigating.
+// - Project <select>s marked data-options="projects" share one list of
+//   <option>s, fetched once. Selects also marked data-lazy (one per table
+//   row) are only filled when they are first used.
+// - The data-search box looks up employees and projects as you type.
+(function () {
+    var script = document.currentScript;
+    var projectOptions = null;
+
+    function getProjectOptions() {
+        if (!projectOptions) {
+            projectOptions = fetch(script.dataset.projectOptions, {credentials: 'same-origin'})
+                .then(function (response) { return response.text(); })
+                .then(function (html) {
+                    var template = document.createElement('template');
+                    template.innerHTML = html;
+                    return template.content;
+                });
+        }
+        return projectOptions;
+    }
+
+    function fillSelect(select) {
+        if (select.dataset.filled) {
+            return;
+        }
+        select.dataset.filled = '1';
+        getProjectOptions().then(function (options) {
+            if (select.hasAttribute('data-lazy')) {
+                select.innerHTML = '';  // drop the placeholder
+            }
+            select.appendChild(options.cloneNode(true));
+        });
+    }
+
+    function setUpSelects(root) {
+        root.querySelectorAll('select[data-options="projects"]').forEach(function (select) {
+            if (select.hasAttribute('data-lazy')) {
+                select.addEventListener('focus', function () { fillSelect(select); });
+                select.addEventListener('mousedown', function () { fillSelect(select); });
+            } else {
+                fillSelect(select);
+            }
+        });
+    }
+
+    function loadFragment(container, url) {
+        container.setAttribute('aria-busy', 'true');
+        return fetch(url, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.text();
+            })
+            .then(function (html) {
+                container.innerHTML = html;
+                setUpSelects(container);
+            })
+            .catch(function () {
+                container.innerHTML = '<a href="' + url + '">Could not load this list; open it on its own</a>';
+            })
+            .finally(function () {
+                container.removeAttribute('aria-busy');
+            });
+    }
+
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest('[data-fragment] a[data-fragment-link]');
+        if (link) {
+            event.preventDefault();
+            var container = link.closest('[data-fragment]');
+            loadFragment(container, link.href).then(function () {
+                container.scrollIntoView();
+            });
+        }
+    });
+
+    var containers = document.querySelectorAll('[data-fragment]');
+    if ('IntersectionObserver' in window) {
+        var observer = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    loadFragment(entry.target, entry.target.dataset.fragment);
+                }
+            });
+        }, {rootMargin: '200px'});
+        containers.forEach(function (container) { observer.observe(container); });
+    } else {
+        containers.forEach(function (container) {
+            loadFragment(container, container.dataset.fragment);
+        });
+    }
+
+    setUpSelects(document);
+
+    var searchBox = document.querySelector('input[data-search]');
+    var searchResults = document.getElementById('search-results');
+    var searchTimer = null;
+    var searchCounter = 0;
+
+    function editLink(template, id, text) {
+        // The URLs were rendered with id 0 as a placeholder
+        var item = document.createElement('li');
+        var link = document.createElement('a');
+        link.href = template.replace(/0$/, id);
+        link.textContent = text;
+        item.appendChild(link);
+        return item;
+    }
+
+    function runSearch() {
+        var query = searchBox.value.trim();
+        var counter = ++searchCounter;
+        if (query.length < 2) {
+            searchResults.innerHTML = '';
+            return;
+        }
+        fetch(searchBox.dataset.search + '?q=' + encodeURIComponent(query), {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                if (counter !== searchCounter) {
+                    return;  // an answer to an older query
+                }
+                searchResults.innerHTML = '';
+                data.employees.forEach(function (e) {
+                    var name = [e.first_name, e.last_name].filter(Boolean).join(' ');
+                    searchResults.appendChild(editLink(searchBox.dataset.employeeUrl, e.id,
+                        'Employee: ' + e.username + (name ? ' (' + name + ')' : '')));
+                });
+                data.projects.forEach(function (p) {
+                    searchResults.appendChild(editLink(searchBox.dataset.projectUrl, p.id, 'Project: ' + p.name));
+                });
+            });
+    }
+
+    if (searchBox) {
+        searchBox.addEventListener('input', function () {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(runSearch, 150);
+        });
+    }
+})();